@@ -0,0 +1,144 @@
+import sys
+import time
+import numpy as np
+import shapely
+
+def ray_hull_rates(centers,corners,hulls) :
+  """
+  凸包の内部の点 centers から各頂点 corners への線分のうち、凸包に含まれる部分の長さの比を求める。
+  凸包の各辺の外向きの法線 n と n・x = d から、中心 c から頂点 p へ進んで辺を越える位置
+  t = (d - n・c) / (n・(p - c)) の最小値(1 を超える場合は 1)になる
+  Parameters
+  ----------
+  centers : ndarray of float
+      (建物数, 2) の中心
+  corners : ndarray of float
+      (建物数, 頂点数, 2) の頂点
+  hulls : ndarray of Polygon
+      建物ごとの凸包
+  Returns
+  -------
+  rates : ndarray of float
+      (建物数, 頂点数) の比。頂点が中心と重なる場合は inf
+  """
+  n = len(centers)
+  rates = np.full(corners.shape[:2],np.inf)
+  if(n == 0) :
+    return rates
+  coords,index = shapely.get_coordinates(shapely.get_exterior_ring(hulls),return_index=True)
+  # 同じ凸包の隣り合う座標が辺になる
+  same = index[:-1] == index[1:]
+  p1,p2,owner = coords[:-1][same],coords[1:][same],index[:-1][same]
+  # 符号付き面積で向きを揃え、外向きの法線にする
+  orientation = np.sign(np.bincount(owner,p1[:,0] * p2[:,1] - p2[:,0] * p1[:,1],minlength=n))
+  d = p2 - p1
+  normals = np.column_stack([d[:,1],-d[:,0]]) * orientation[owner,None]
+  offsets = (normals * (p1 - centers[owner])).sum(axis=1)
+
+  rays = corners - centers[:,None,:]
+  with np.errstate(divide='ignore',invalid='ignore') :
+    speeds = (normals[:,None,:] * rays[owner]).sum(axis=2)
+    t = np.where(speeds > 0,offsets[:,None] / speeds,np.inf)
+  # 凸包ごとの最小値
+  starts = np.searchsorted(owner,np.arange(n))
+  has_edges = np.isin(np.arange(n),owner)
+  rates[has_edges] = np.minimum(np.minimum.reduceat(t,starts[has_edges],axis=0),1.)
+  rates[~(rays != 0).any(axis=2)] = np.inf
+  return rates
+
+def simplize_rects(targets) :
+  """
+  建物の形状をまとめて矩形に単純化する(makeScrollMap5 の simplize_1 の一括版)。
+  最小回転外接矩形を建物の重心に移し、各頂点から重心への線分が凸包と交わる
+  長さの比の最小値で重心を中心に縮める
+  Parameters
+  ----------
+  targets : array_like of Geometry
+      建物の形状の配列
+  Returns
+  -------
+  shrinked_rects : ndarray of Geometry
+      縮めた矩形。単純化できない形状(面積0など)は None
+  tg_cv_rate : ndarray of float
+      建物の面積 / 凸包の面積(凸包の面積が0の場合は0)
+  tg_min_rate : ndarray of float
+      矩形の面積 / 建物の面積(建物の面積が0の場合は0)
+  """
+  targets = np.asarray(targets,dtype=object)
+  n = len(targets)
+  shrinked_rects = np.full(n,None,dtype=object)
+  tg_cv_rate = np.zeros(n)
+  tg_min_rate = np.zeros(n)
+  if(n == 0) :
+    return shrinked_rects,tg_cv_rate,tg_min_rate
+
+  convex_hulls = shapely.convex_hull(targets)
+  target_areas = shapely.area(targets)
+  hull_areas = shapely.area(convex_hulls)
+  np.divide(target_areas,hull_areas,out=tg_cv_rate,where=hull_areas > 0)
+
+  rects = shapely.minimum_rotated_rectangle(targets)
+  # 矩形にならない(線や点になる)ものは単純化できない
+  ok = np.flatnonzero(shapely.get_type_id(rects) == shapely.GeometryType.POLYGON)
+  if(len(ok) == 0) :
+    return shrinked_rects,tg_cv_rate,tg_min_rate
+
+  # 矩形の重心を建物の重心に移す
+  centers = shapely.get_coordinates(shapely.centroid(targets[ok]))
+  corners = shapely.get_coordinates(shapely.get_exterior_ring(rects[ok])).reshape(len(ok),5,2)
+  corners += (centers - shapely.get_coordinates(shapely.centroid(rects[ok])))[:,None,:]
+
+  # 頂点から重心への線分と凸包の共通部分の長さの比
+  rates = ray_hull_rates(centers,corners[:,:4],convex_hulls[ok]).min(axis=1)
+  valid = np.isfinite(rates)
+  ok,rates,centers,corners = ok[valid],rates[valid],centers[valid],corners[valid]
+
+  # 凸包に収まる最大の倍率は各頂点の比の最小値なので、それで縮める
+  shrinked = centers[:,None,:] + (corners - centers[:,None,:]) * rates[:,None,None]
+  shrinked_rects[ok] = shapely.polygons(shrinked)
+  areas = target_areas[ok]
+  tg_min_rate[ok] = np.where(areas > 0,shapely.area(shrinked_rects[ok]) / np.where(areas > 0,areas,1.),0.)
+  return shrinked_rects,tg_cv_rate,tg_min_rate
+
+if __name__ == "__main__":
+  # python batch_simplify.py [件数] : 1件ずつの simplize_1 と時間・結果を比較する
+  from shapely import affinity,geometry
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+  rng = np.random.default_rng(0)
+  targets = []
+  while(len(targets) < count) :
+    k = rng.integers(4,10)
+    angles = np.sort(rng.uniform(0,2 * np.pi,k))
+    r = rng.uniform(0.5,1.5,k)
+    target = geometry.Polygon(np.c_[r * np.cos(angles),r * np.sin(angles)] * 1e-4 + rng.uniform(0,1e-2,2) + [136.9,35.1])
+    if(target.is_valid) :
+      targets.append(target)
+
+  def simplize_1(target) :
+    # makeScrollMap5 の simplize_1
+    rect = target.minimum_rotated_rectangle
+    convex_hull = target.convex_hull
+    x1,y1 = rect.centroid.x,rect.centroid.y
+    x2,y2 = target.centroid.x,target.centroid.y
+    translated_rect = affinity.translate(rect,x2-x1,y2-y1)
+    rates = np.empty(0)
+    for pt in translated_rect.exterior.coords :
+      lst = geometry.LineString((pt,(x2,y2)))
+      intersects = convex_hull.intersection(lst)
+      rates = np.append(rates,[i.length / lst.length for i in getattr(intersects,'geoms',[intersects])])
+    rates = np.unique(rates)
+    shrinked_rect = None
+    for rate in rates :
+      rect_s = affinity.scale(translated_rect,rate,rate,1.0,(x2,y2))
+      if convex_hull.contains(rect_s) :
+        shrinked_rect = rect_s if shrinked_rect == None else max(rect_s,shrinked_rect,key=lambda r:r.area)
+    return affinity.scale(translated_rect,np.min(rates),np.min(rates),1.0,(x2,y2)) if shrinked_rect == None else shrinked_rect
+
+  start = time.time()
+  expected = [simplize_1(t) for t in targets]
+  time_scalar = time.time() - start
+  start = time.time()
+  shrinked_rects,tg_cv_rate,tg_min_rate = simplize_rects(targets)
+  time_batch = time.time() - start
+  diff = max(r.hausdorff_distance(e) / np.sqrt(e.area) for r,e in zip(shrinked_rects,expected))
+  print(f'buildings:{count} simplize_1:{time_scalar:.3f}[sec] batch:{time_batch:.3f}[sec] speedup:{time_scalar / max(time_batch,1e-9):.1f}x max diff:{diff:.2e}')
@@ -0,0 +1,185 @@
+import concurrent.futures
+import functools
+import numpy as np
+import shapely
+from shapely import geometry
+from simplify_strategies import simplify,SimplifyStats
+from get_height import get_jaxa_dsm_heights_rect
+from dem_index import DemIndex
+from dem_raster import load_dem_raster,raster_points,get_dem_heights,is_dem_available
+from jaxa_dsm import attach_shared_cells
+from result_cache import get_result_key
+
+# 処理結果が変わる修正をしたら上げる(結果のキャッシュのキーに含める)
+ALGORITHM_VERSION = 7
+# タイルごとのDEMの標高点の索引(プロセスごと)
+_dem_indexes = {}
+
+def make_work_item(coords,feature_type,tile) :
+  """
+  プロセスに渡す建物1件分の作業データを作る
+  Parameters
+  ----------
+  coords : list of [x, y]
+      結合した建物の外周の座標
+  feature_type : str
+      建物のタイプ('普通建物' など)
+  tile : tuple of int
+      建物の属するFGDタイルの (X, Y)
+  """
+  return (np.asarray(coords,dtype=np.float64).reshape(-1,2),feature_type,(int(tile[0]),int(tile[1])))
+
+def correct_height(feature_type,height) :
+  # 建物の高さ補正
+  if(feature_type == '普通建物' and height < 3.0) :
+    height += 3.0
+  elif (feature_type == '堅ろう建物') :
+    if(height < 6.0) :
+      height += 9.0
+    elif (height < 9.0) :
+      height = 9.0
+  return height
+
+def _tile_dem_index(tile) :
+  # 標高を補間できなかった建物は、属するタイルのDEMの標高点から最も近いものを使う。
+  # タイルに標高点が無い場合は周囲8タイルの標高点を使う。
+  # ワーカーの中でダウンロードしないように、取得済みの周囲のタイルだけを使う
+  if(tile not in _dem_indexes) :
+    points = raster_points(*load_dem_raster(*tile))
+    if(len(points) == 0) :
+      x,y = tile
+      neighbours = [(x + dx,y + dy) for dx in (-1,0,1) for dy in (-1,0,1) if (dx,dy) != (0,0)]
+      points = [p for nx,ny in neighbours if is_dem_available(nx,ny) for p in raster_points(*load_dem_raster(nx,ny))]
+    _dem_indexes[tile] = DemIndex.from_points(points)
+  return _dem_indexes[tile]
+
+def process_chunk(items,policy = 'shrink_hull',budget = None) :
+  """
+  建物をまとめて矩形に単純化し、DSM・DEMから高さを求める
+  Parameters
+  ----------
+  items : list of tuple
+      make_work_item で作った作業データのリスト
+  policy : str
+      単純化の方法(simplify_strategies.simplify を参照)
+  budget : maxrect.Budget
+      建物1件あたりの単純化の計算時間と回数の上限
+  Returns
+  -------
+  results : list of tuple
+      建物ごとの (矩形の座標のリスト, 属性の辞書, エラーメッセージ)。
+      複数の矩形に分けた建物(rectilinear)は面積の大きい順に複数の座標を返す。
+      エラーの場合(DSM・DEMのデータが無い建物を含む)は矩形の座標と属性が None。
+      上限を超えて打ち切った建物は属性の timed_out が True
+  stats : SimplifyStats
+      単純化の方法ごとの集計
+  """
+  stats = SimplifyStats()
+  targets = [geometry.Polygon(coords) if len(coords) > 2 else geometry.LineString(coords) for coords,_,_ in items]
+  shrinked_rects,tg_cv_rates,tg_min_rates,_,timed_out = simplify(targets,policy,stats,budget)
+  simplized = np.array([r is not None for r in shrinked_rects],dtype=bool)
+
+  dsm_heights = np.zeros(len(items))
+  dsm_heights[simplized] = get_jaxa_dsm_heights_rect(shrinked_rects[simplized])[0]
+  # 地表の高さは矩形の重心でDEMのラスターを補間する
+  dem_heights = np.zeros(len(items))
+  centroids = shapely.get_coordinates(shapely.centroid(shrinked_rects[simplized]))
+  dem_heights[simplized] = get_dem_heights(centroids[:,0],centroids[:,1])
+
+  results = []
+  for i,(_,feature_type,tile) in enumerate(items) :
+    try :
+      if(not simplized[i]) :
+        raise ValueError('cannot simplize')
+      dem = dem_heights[i]
+      if(np.isnan(dem)) :
+        dem_index = _tile_dem_index(tile)
+        if(dem_index.tree is None) :
+          # 周囲のタイルにも標高点が無い
+          raise ValueError('no DEM data')
+        dem = dem_index.nearest_to_geometries(shrinked_rects[i:i + 1])[0]
+      dsm = float(dsm_heights[i])
+      if(np.isnan(dsm)) :
+        # DSMの区画のファイルが無い
+        raise ValueError('no DSM data')
+      dem = float(dem)
+      if(dem > dsm) :
+        dem,dsm = dsm,dem
+      props = {
+        'dsm':dsm,
+        'dem':dem,
+        'height':correct_height(feature_type,dsm - dem),
+        'tg_cv_rate':float(tg_cv_rates[i]),
+        'tg_min_rate':float(tg_min_rates[i]),
+        'timed_out':bool(timed_out[i])
+      }
+      results.append(([geometry.mapping(rect)['coordinates'][0] for rect in getattr(shrinked_rects[i],'geoms',[shrinked_rects[i]])],props,None))
+    except Exception as e :
+      results.append((None,None,str(e)))
+  return results,stats
+
+def _attach_dsm(registry) :
+  # ワーカーの初期化時に共有メモリのDSMを登録する
+  from get_height import dsm_mosaic
+  attach_shared_cells(registry,dsm_mosaic.reader)
+
+def process_buildings(items,workers = 1,chunk_size = 256,shared_dsm = None,cache = None,policy = 'shrink_hull',stats = None,budget = None) :
+  """
+  建物の作業データをチャンクに分けて処理する。workers が2以上の場合は
+  プロセスプールで並列に処理し、結果は items と同じ順序で返す
+  Parameters
+  ----------
+  items : list of tuple
+      make_work_item で作った作業データのリスト
+  workers : int
+      プロセス数
+  chunk_size : int
+      1回に渡す建物の数
+  shared_dsm : dict
+      SharedDsmCells.registry。指定するとワーカーは共有メモリのDSMを読む
+  cache : ResultCache
+      処理結果のキャッシュ。指定するとキャッシュに無い建物だけを処理する。
+      エラーの結果と打ち切った結果は保存しない
+  policy : str
+      単純化の方法(simplify_strategies.simplify を参照)
+  stats : SimplifyStats
+      単純化の方法ごとの集計と、キャッシュから読んだ件数(result_cache)を加える
+  budget : maxrect.Budget
+      建物1件あたりの単純化の計算時間と回数の上限
+  Returns
+  -------
+  results : list of tuple
+      process_chunk を参照
+  """
+  results = [None] * len(items)
+  keys = None
+  if(cache is not None) :
+    params = {'policy':policy,'budget':[budget.seconds,budget.iterations] if budget is not None else None}
+    keys = [get_result_key(coords,feature_type,tile,ALGORITHM_VERSION,params) for coords,feature_type,tile in items]
+    cached = cache.get_many(keys)
+    for i,key in enumerate(keys) :
+      if(key in cached) :
+        results[i] = tuple(cached[key])
+  todo = [i for i,r in enumerate(results) if r is None]
+  if(cache is not None and stats is not None) :
+    stats.add('result_cache',len(items),len(items) - len(todo))
+
+  chunks = [[items[i] for i in todo[j:j + chunk_size]] for j in range(0,len(todo),chunk_size)]
+  process = functools.partial(process_chunk,policy=policy,budget=budget)
+  if(workers <= 1 or len(chunks) <= 1) :
+    chunk_results = [process(chunk) for chunk in chunks]
+  else :
+    initializer,initargs = (_attach_dsm,(shared_dsm,)) if shared_dsm else (None,())
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=initializer,initargs=initargs) as executor :
+      chunk_results = list(executor.map(process,chunks))
+  computed = [r for chunk_result,_ in chunk_results for r in chunk_result]
+  if(stats is not None) :
+    for _,chunk_stats in chunk_results :
+      stats.merge(chunk_stats)
+
+  for i,r in zip(todo,computed) :
+    results[i] = r
+  if(cache is not None and len(todo) > 0) :
+    # エラーや打ち切りの結果は次回に処理し直すので保存しない
+    cache.put_many([(keys[i],results[i]) for i in todo if results[i][2] is None and not results[i][1]['timed_out']])
+  return results
@@ -0,0 +1,163 @@
+import json
+import math
+import os
+import sys
+import numpy as np
+import shapely
+import latlon2tile as l2t
+from tile_store import get_store
+from jaxa_dsm import get_memmap_path
+
+work_dir = '../../temp/'
+basedata_dir = '../../temp/basedata/'
+
+def get_tile_num_np(coords,zoom):
+  # https:#wiki.openstreetmap.org/wiki/Slippy_map_tilenames#Python
+  lat_rad = np.radians(coords[:,1])
+  n = 2.0 ** zoom
+  xtile = (coords[:,0] + 180.0) / 360.0 * n
+  ytile = (1.0 - np.log(np.tan(lat_rad) + (1 / np.cos(lat_rad))) / np.pi) / 2.0 * n
+  return (xtile, ytile)
+
+def load_route(path) :
+  """
+  ルートのGeoJSONから経路の経度・緯度を取得する
+  Returns
+  -------
+  coords : ndarray
+      (経度, 緯度) の配列
+  """
+  with open(path,'r') as f :
+    root_map = json.load(f)
+  coords = np.array(root_map['features'][0]['geometry']['coordinates'])
+  return coords[:,0:2]
+
+def get_corridor_tiles(coords,zoom = 18,buffer_width = 2.) :
+  """
+  経路に沿った回廊に含まれるタイルを経路順に重複なく列挙する
+  Parameters
+  ----------
+  coords : ndarray
+      経路の (経度, 緯度) の配列
+  zoom : int
+      タイルのズーム率
+  buffer_width : float
+      回廊の幅(経路からのタイル数)
+  Returns
+  -------
+  tiles : list of (int, int)
+      タイル座標 (x, y) のリスト
+  """
+  coords = np.stack(get_tile_num_np(np.asarray(coords,dtype=np.float64).reshape(-1,2),zoom)).T
+  if(len(coords) == 0) :
+    return []
+  if(len(coords) < 2) :
+    # 1点だけの経路は点の周りの正方形を回廊にする
+    segments = shapely.points(coords)
+  else :
+    segments = shapely.linestrings(np.stack((coords[:-1],coords[1:]),axis=1))
+  buffers = shapely.buffer(segments,buffer_width,quad_segs=16,cap_style='square',join_style='bevel')
+  # 経路全体の回廊を1つのポリゴンにまとめて判定する
+  corridor = shapely.union_all(buffers)
+  shapely.prepare(corridor)
+
+  # 候補となる格子点は区間ごとの範囲から作る
+  bounds = shapely.bounds(buffers)
+  lo = np.floor(bounds[:,0:2]).astype(np.int64)
+  hi = np.ceil(bounds[:,2:4]).astype(np.int64)
+  size = hi - lo + 1
+  count = size[:,0] * size[:,1]
+  segment = np.repeat(np.arange(len(buffers)),count)
+  local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count,count)
+  x = lo[segment,0] + local % size[segment,0]
+  y = lo[segment,1] + local // size[segment,0]
+  # 1次元のキーにして重複を除く
+  xmin,ymin = lo.min(axis=0)
+  width = hi[:,0].max() - xmin + 1
+  keys = np.unique((y - ymin) * width + (x - xmin))
+  x = keys % width + xmin
+  y = keys // width + ymin
+  inside = shapely.contains_xy(corridor,x,y)
+  x,y = x[inside],y[inside]
+
+  # 経路上で最も近い位置の順に並べる
+  points = shapely.points(x,y)
+  position = np.zeros(len(points))
+  if(len(coords) >= 2) :
+    point_idx,segment_idx = shapely.STRtree(segments).query_nearest(points,all_matches=False)
+    position[point_idx] = segment_idx + shapely.line_locate_point(segments[segment_idx],points[point_idx],normalized=True)
+  order = np.lexsort((x,y,position))
+  return [(int(tx),int(ty)) for tx,ty in zip(x[order],y[order])]
+
+def get_dsm_cells(tiles,zoom = 18) :
+  """
+  タイルを覆うJAXA ALOS全球数値地表モデル(1度単位)のセル名を列挙する
+  Returns
+  -------
+  cells : list of str
+      'N035E136' 形式のセル名のリスト
+  """
+  cells = {}
+  for x,y in tiles :
+    lon1,lat1,lon2,lat2 = l2t.get_tile_bbox(zoom,x,y)
+    for lat in range(math.floor(lat1),math.floor(lat2) + 1) :
+      for lon in range(math.floor(lon1),math.floor(lon2) + 1) :
+        cells[f'N{lat:03}E{lon:03}'] = True
+  return list(cells)
+
+def make_manifest(coords,zoom = 18,buffer_width = 2.) :
+  """
+  経路から処理に必要なタイルの一覧(マニフェスト)を作成する
+  Returns
+  -------
+  manifest : dict
+      'zoom','fgd','dem','dsm' をキーとする辞書
+  """
+  tiles = get_corridor_tiles(coords,zoom,buffer_width)
+  return {
+    'zoom':zoom,
+    'fgd':[list(t) for t in tiles],
+    'dem':[list(t) for t in tiles],
+    'dsm':get_dsm_cells(tiles,zoom)
+  }
+
+def manifest_tiles(manifest) :
+  # ダウンローダーに渡す (レイヤー名, x, y) のリスト
+  return [(layer,x,y) for layer in ('fgd','dem') for x,y in manifest[layer]]
+
+def write_manifest(manifest,path = f'{work_dir}manifest.json') :
+  with open(path,mode='w') as f :
+    json.dump(manifest,f)
+
+def get_cache_status(manifest) :
+  """
+  マニフェストのタイルのキャッシュ有無を集計する
+  Returns
+  -------
+  status : dict
+      レイヤーごとの {'total','hit','miss'}
+  """
+  status = {}
+  store = get_store()
+  for layer in ('fgd','dem') :
+    hit = len(manifest[layer]) - len(store.missing([(layer,manifest['zoom'],x,y) for x,y in manifest[layer]]))
+    status[layer] = {'total':len(manifest[layer]),'hit':hit,'miss':len(manifest[layer]) - hit}
+  # 変換済みの配列ファイルだけがある区画も取得済みとする
+  hit = sum(1 for key in manifest['dsm']
+    if os.path.exists(get_memmap_path(key,basedata_dir)) or os.path.exists(f'{basedata_dir}ALPSMLC30_{key}_DSM.tif'))
+  status['dsm'] = {'total':len(manifest['dsm']),'hit':hit,'miss':len(manifest['dsm']) - hit}
+  return status
+
+def print_cache_status(manifest) :
+  for layer,s in get_cache_status(manifest).items() :
+    unit = 'cells' if layer == 'dsm' else 'tiles'
+    print(f"{layer}: {s['total']} {unit} (cache hit:{s['hit']} miss:{s['miss']})")
+
+if __name__ == "__main__":
+  # python corridor_planner.py [route.json] [--dry-run]
+  args = [a for a in sys.argv[1:] if not a.startswith('--')]
+  route_path = args[0] if len(args) > 0 else f'{work_dir}test.json'
+  manifest = make_manifest(load_route(route_path))
+  print_cache_status(manifest)
+  if('--dry-run' not in sys.argv) :
+    write_manifest(manifest)
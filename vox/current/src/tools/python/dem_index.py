@@ -0,0 +1,104 @@
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+class DemIndex :
+  """
+  DEM10B の標高点を配列にまとめ、KD木で近傍の標高を引く。
+  経度は中心緯度の cos を掛けて緯度と同じ尺度の距離にする
+  """
+  def __init__(self,lon,lat,alti) :
+    """
+    Parameters
+    ----------
+    lon, lat : array_like of float
+        標高点の経度と緯度
+    alti : array_like of float
+        標高
+    """
+    self.lon = np.asarray(lon,dtype=np.float64)
+    self.lat = np.asarray(lat,dtype=np.float64)
+    self.alti = np.asarray(alti,dtype=np.float64)
+    self.lon_scale = np.cos(np.radians(self.lat.mean())) if len(self.lat) > 0 else 1.
+    self.tree = cKDTree(self._xy(self.lon,self.lat)) if len(self.lon) > 0 else None
+
+  @classmethod
+  def from_points(cls,points) :
+    # (経度, 緯度, 標高) のリストから作る。重複した点は1つにまとめる
+    points = np.unique(np.asarray(points,dtype=np.float64).reshape(-1,3),axis=0)
+    return cls(points[:,0],points[:,1],points[:,2])
+
+  def _xy(self,lon,lat) :
+    return np.column_stack([np.asarray(lon,dtype=np.float64).reshape(-1) * self.lon_scale,np.asarray(lat,dtype=np.float64).reshape(-1)])
+
+  def nearest(self,lon,lat,k = 1) :
+    """
+    各地点の近傍の標高点を求める
+    Parameters
+    ----------
+    lon, lat : array_like of float
+        地点の経度と緯度
+    k : int
+        求める近傍点の数
+    Returns
+    -------
+    alti : ndarray
+        近い順の標高。k = 1 の場合は (n,)、それ以外は (n, k)
+    distance : ndarray
+        標高点までの距離(度)
+    index : ndarray
+        標高点の番号
+    """
+    if(self.tree is None) :
+      raise ValueError('no DEM points')
+    k = min(k,len(self.alti))
+    distance,index = self.tree.query(self._xy(lon,lat),k=k)
+    return self.alti[index],distance,index
+
+  def interpolate(self,lon,lat,k = 4,power = 2.) :
+    """
+    各地点の標高を近傍 k 点の逆距離加重で補間する
+    Returns
+    -------
+    alti : ndarray
+        補間した標高
+    """
+    alti,distance,_ = self.nearest(lon,lat,max(k,2))
+    alti = alti.reshape(len(distance),-1)
+    distance = distance.reshape(len(alti),-1)
+    with np.errstate(divide='ignore') :
+      weight = 1. / distance ** power
+    # 標高点と重なる地点はその点の標高にする
+    exact = distance[:,0] == 0
+    weight[exact] = 0.
+    weight[exact,0] = 1.
+    return (alti * weight).sum(axis=1) / weight.sum(axis=1)
+
+  def nearest_to_geometries(self,geometries,k = 8,interpolate = False) :
+    """
+    建物の形状に最も近い標高点の標高を求める。
+    重心の近傍 k 点を候補にして、形状からの距離が最小のものを選ぶ
+    Parameters
+    ----------
+    geometries : array_like of Geometry
+        建物の形状の配列
+    k : int
+        候補にする近傍点の数
+    interpolate : bool
+        True の場合は重心の標高を逆距離加重で補間する
+    Returns
+    -------
+    alti : ndarray
+        標高
+    """
+    geometries = np.asarray(geometries,dtype=object)
+    if(len(geometries) == 0) :
+      return np.empty(0)
+    centroids = shapely.get_coordinates(shapely.centroid(geometries))
+    if(interpolate) :
+      return self.interpolate(centroids[:,0],centroids[:,1])
+    _,_,index = self.nearest(centroids[:,0],centroids[:,1],k)
+    index = index.reshape(len(geometries),-1)
+    points = shapely.points(self.lon[index],self.lat[index])
+    distance = shapely.distance(geometries[:,None],points)
+    return self.alti[index[np.arange(len(index)),np.argmin(distance,axis=1)]]
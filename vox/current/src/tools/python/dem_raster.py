@@ -0,0 +1,141 @@
+import io
+import numpy as np
+from tile_store import get_store,load_tile
+from corridor_planner import get_tile_num_np
+
+# ラスターを保存するタイルストアのレイヤー名(タイルごとのファイルは作らない)
+cache_layer = 'dem-raster'
+
+# プロセス内で読み込んだラスター
+_rasters = {}
+
+def features_to_raster(features) :
+  """
+  dem10b タイルの標高点(alti)を格子状のラスターに並べる
+  Parameters
+  ----------
+  features : list of dict
+      dem10b タイルのPointのフィーチャー
+  Returns
+  -------
+  raster : ndarray of float32
+      標高(北から南の行、西から東の列)。標高点の無いピクセルは NaN
+  georef : ndarray of float64
+      (左上の経度, 左上の緯度, 列の間隔, 行の間隔)。左上はピクセルの中心
+  """
+  points = np.array([f['geometry']['coordinates'][0:2] + [f['properties']['alti']] for f in features
+    if f['geometry']['type'] == 'Point' and f['properties'].get('alti') is not None],dtype=np.float64).reshape(-1,3)
+  if(len(points) == 0) :
+    return np.full((0,0),np.nan,dtype=np.float32),np.array([0.,0.,1.,1.])
+  lons = np.unique(np.round(points[:,0],9))
+  lats = np.unique(np.round(points[:,1],9))
+  dx = np.median(np.diff(lons)) if len(lons) > 1 else 1.
+  dy = np.median(np.diff(lats)) if len(lats) > 1 else 1.
+  x0,y0 = lons[0],lats[-1]
+  cols = np.rint((points[:,0] - x0) / dx).astype(np.int64)
+  rows = np.rint((y0 - points[:,1]) / dy).astype(np.int64)
+  raster = np.full((rows.max() + 1,cols.max() + 1),np.nan,dtype=np.float32)
+  raster[rows,cols] = points[:,2]
+  return raster,np.array([x0,y0,dx,dy])
+
+def pack_raster(raster,georef) :
+  # ラスターと位置を1つのデータにまとめる
+  buf = io.BytesIO()
+  np.savez(buf,raster=raster,georef=georef)
+  return buf.getvalue()
+
+def unpack_raster(data) :
+  with np.load(io.BytesIO(data)) as z :
+    return z['raster'],z['georef']
+
+def load_dem_raster(x,y,zoom = 18) :
+  """
+  dem10b タイルのラスターを読み込む。無ければタイルから作ってタイルストアに保存する
+  Returns
+  -------
+  raster : ndarray of float32
+  georef : ndarray of float64
+      features_to_raster を参照
+  """
+  key = (zoom,x,y)
+  if(key in _rasters) :
+    return _rasters[key]
+  store = get_store()
+  data = store.get_bytes(cache_layer,zoom,x,y)
+  if(data is not None) :
+    result = unpack_raster(data)
+  else :
+    result = features_to_raster(load_tile('dem',x,y,zoom)['features'])
+    store.put(cache_layer,zoom,x,y,pack_raster(*result))
+  _rasters[key] = result
+  return result
+
+def is_dem_available(x,y,zoom = 18) :
+  # タイルをダウンロードせずに読み込めるか(読み込み済み、またはタイルストアにある)
+  if((zoom,x,y) in _rasters) :
+    return True
+  return len(get_store().missing([(cache_layer,zoom,x,y),('dem',zoom,x,y)])) < 2
+
+def raster_points(raster,georef) :
+  # ラスターの標高点を (経度, 緯度, 標高) のリストに戻す。
+  # dem10b の標高は0.1m単位なので float32 の端数は丸める
+  rows,cols = np.nonzero(~np.isnan(raster))
+  x0,y0,dx,dy = georef
+  return list(zip((x0 + cols * dx).tolist(),(y0 - rows * dy).tolist(),np.round(raster[rows,cols].astype(np.float64),2).tolist()))
+
+def bilinear(raster,georef,lon,lat) :
+  """
+  ラスターの標高を双線形補間する。範囲外は端の値を使い、
+  NaN のピクセルは除いて残りの重みで補間する
+  Returns
+  -------
+  alti : ndarray of float64
+      標高。周囲に標高点が無い場合は NaN
+  """
+  lon = np.asarray(lon,dtype=np.float64)
+  lat = np.asarray(lat,dtype=np.float64)
+  if(raster.size == 0) :
+    return np.full(lon.shape,np.nan)
+  x0,y0,dx,dy = georef
+  h,w = raster.shape
+  fx = np.clip((lon - x0) / dx,0,w - 1)
+  fy = np.clip((y0 - lat) / dy,0,h - 1)
+  c0 = np.minimum(np.floor(fx).astype(np.int64),max(w - 2,0))
+  r0 = np.minimum(np.floor(fy).astype(np.int64),max(h - 2,0))
+  c1 = np.minimum(c0 + 1,w - 1)
+  r1 = np.minimum(r0 + 1,h - 1)
+  tx = fx - c0
+  ty = fy - r0
+  values = np.stack([raster[r0,c0],raster[r0,c1],raster[r1,c0],raster[r1,c1]]).astype(np.float64)
+  weights = np.stack([(1 - tx) * (1 - ty),tx * (1 - ty),(1 - tx) * ty,tx * ty])
+  weights = np.where(np.isnan(values),0.,weights)
+  total = weights.sum(axis=0)
+  with np.errstate(invalid='ignore',divide='ignore') :
+    return np.where(total > 0,(np.nan_to_num(values) * weights).sum(axis=0) / total,np.nan)
+
+def get_dem_heights(lon,lat,zoom = 18) :
+  """
+  各地点の地表の標高を、その地点を含む dem10b タイルのラスターから双線形補間で求める
+  Parameters
+  ----------
+  lon, lat : array_like of float
+      経度と緯度
+  Returns
+  -------
+  alti : ndarray of float64
+      標高。タイルに標高点が無い場合は NaN
+  """
+  lon = np.asarray(lon,dtype=np.float64).reshape(-1)
+  lat = np.asarray(lat,dtype=np.float64).reshape(-1)
+  alti = np.full(lon.shape,np.nan)
+  if(len(lon) == 0) :
+    return alti
+  xt,yt = get_tile_num_np(np.column_stack([lon,lat]),zoom)
+  tiles = np.column_stack([xt.astype(np.int64),yt.astype(np.int64)])
+  keys,inverse = np.unique(tiles,axis=0,return_inverse=True)
+  inverse = inverse.reshape(-1)
+  for i,(x,y) in enumerate(keys) :
+    sel = inverse == i
+    raster,georef = load_dem_raster(int(x),int(y),zoom)
+    alti[sel] = bilinear(raster,georef,lon[sel],lat[sel])
+  return alti
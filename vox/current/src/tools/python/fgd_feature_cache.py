@@ -0,0 +1,163 @@
+import hashlib
+import io
+import json
+import numpy as np
+from tile_store import get_store,load_tile_text
+from geojson_stream import parse_fgd_tile
+
+# 派生キャッシュを保存するタイルストアのレイヤー名
+cache_layer = 'fgd-features'
+# 保存形式を変えたら上げる
+FORMAT_VERSION = 2
+
+# 座標をまとめて保存するジオメトリ
+PACKED_TYPES = ('Point','LineString')
+# 列として保存する属性(保存する配列の名前と属性名)。残りの属性だけをJSONにする
+PACKED_PROPERTIES = (('cls','class'),('type','type'),('fid','fid'))
+
+# データとして除外するタイプ
+exclude_types = frozenset([
+  '一般等高線',
+  #   '真幅道路',
+  #    '庭園路等',
+  #    '普通建物',
+  #    '堅ろう建物',
+  #    '普通無壁舎',
+  #    '水涯線（河川）',
+  #    '歩道',
+ #     '普通鉄道',
+  #    '分離帯',
+  'トンネル内の鉄道',
+  '大字・町・丁目界',
+  '町村・指定都市の区界',
+  '市区町村界',
+  #    '堅ろう無壁舎',
+  '大字・町・丁目',
+  '標高点（測点）',
+  '水準点',
+  #    '特殊軌道',
+  '町村・指定都市の区',
+      'その他',
+  '郡市・東京都の区',
+  '電子基準点',
+  'トンネル内の道路',
+  '三角点'
+])
+
+def get_cache_key(exclude_types) :
+  # 除外するタイプが変わったらキャッシュを作り直す
+  text = json.dumps([FORMAT_VERSION,sorted(exclude_types)],ensure_ascii=False)
+  return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def pack_features(features,bounds,key) :
+  """
+  フィーチャーを座標配列と列ごとの属性にまとめてシリアライズする。
+  PACKED_PROPERTIES の属性(文字列のもの)は列に、残りの属性はJSONにする
+  """
+  coords = []
+  offsets = [0]
+  geom_types = []
+  records = []
+  columns = {name:[] for name,_ in PACKED_PROPERTIES}
+  # 列に入れた属性のビット
+  packed_mask = []
+  for feature in features :
+    geom = feature['geometry']
+    geom_types.append(geom['type'])
+    props = feature['properties']
+    mask = 0
+    for bit,(name,key) in enumerate(PACKED_PROPERTIES) :
+      value = props.get(key)
+      if(isinstance(value,str)) :
+        mask |= 1 << bit
+        columns[name].append(value)
+      else :
+        columns[name].append('')
+    packed_mask.append(mask)
+    rest = {k:v for k,v in props.items() if k not in [key for bit,(_,key) in enumerate(PACKED_PROPERTIES) if mask & (1 << bit)]}
+    if(geom['type'] in PACKED_TYPES) :
+      c = np.asarray(geom['coordinates'],dtype=np.float64).reshape(-1,2)
+      coords.append(c)
+      offsets.append(offsets[-1] + len(c))
+      records.append({'properties':rest})
+    else :
+      offsets.append(offsets[-1])
+      records.append({'properties':rest,'geometry':geom})
+  buf = io.BytesIO()
+  np.savez(buf,
+    key=np.array(key),
+    bounds=np.array(bounds,dtype=np.float64),
+    coords=np.concatenate(coords) if len(coords) > 0 else np.empty((0,2)),
+    offsets=np.array(offsets,dtype=np.int64),
+    geom_type=np.array(geom_types,dtype=str),
+    packed_mask=np.array(packed_mask,dtype=np.uint8),
+    **{name:np.array(values,dtype=str) for name,values in columns.items()},
+    records=np.array(json.dumps(records,ensure_ascii=False)))
+  return buf.getvalue()
+
+def unpack_features(data) :
+  """
+  pack_featuresでシリアライズしたデータを読み込む
+  Returns
+  -------
+  packed : dict
+      'key','bounds','coords','offsets','geom_type','packed_mask','cls','type','fid','records'
+  """
+  with np.load(io.BytesIO(data)) as z :
+    return {k:z[k] for k in z.files}
+
+def to_features(packed) :
+  # GeoJSONのフィーチャーに戻す。座標と列の属性は配列からまとめてリストにする
+  coords = packed['coords'].tolist()
+  offsets = packed['offsets'].tolist()
+  masks = packed['packed_mask'].tolist()
+  columns = [(1 << bit,key,packed[name].tolist()) for bit,(name,key) in enumerate(PACKED_PROPERTIES)]
+  records = json.loads(str(packed['records']))
+  features = []
+  for i,(geom_type,record) in enumerate(zip(packed['geom_type'].tolist(),records)) :
+    if(geom_type == 'Point') :
+      geom = {'type':geom_type,'coordinates':coords[offsets[i]]}
+    elif(geom_type == 'LineString') :
+      geom = {'type':geom_type,'coordinates':coords[offsets[i]:offsets[i + 1]]}
+    else :
+      geom = record['geometry']
+    props = {key:values[i] for bit,key,values in columns if masks[i] & bit}
+    props.update(record['properties'])
+    features.append({'type':'Feature','geometry':geom,'properties':props})
+  return features
+
+def load_fgd_features(x,y,exclude_types,zoom = 18) :
+  """
+  除外するタイプを取り除いたFGDタイルのフィーチャーを読み込む。
+  派生キャッシュがあればJSONのタイルは読まない
+  Parameters
+  ----------
+  x : int
+      タイルのX座標
+  y : int
+      タイルのY座標
+  exclude_types : collection of str
+      除外するフィーチャーのタイプ
+  Returns
+  -------
+  map : dict
+      フィルタ済みのFeatureCollection
+  bounds : tuple of float
+      フィルタ前の全フィーチャーから求めたタイルの範囲 (xmin, xmax, ymin, ymax)
+  """
+  store = get_store()
+  key = get_cache_key(exclude_types)
+  data = store.get_bytes(cache_layer,zoom,x,y)
+  packed = unpack_features(data) if data is not None else None
+  if(packed is None or str(packed['key']) != key) :
+    # 除外するフィーチャーは読み飛ばしながら解析する
+    try :
+      features,bounds = parse_fgd_tile(load_tile_text('fgd',x,y,zoom),exclude_types)
+    except ValueError :
+      # 保存済みのタイルが壊れている場合は削除して取得し直す
+      store.delete('fgd',zoom,x,y)
+      features,bounds = parse_fgd_tile(load_tile_text('fgd',x,y,zoom),exclude_types)
+    data = pack_features(features,bounds,key)
+    store.put(cache_layer,zoom,x,y,data)
+    packed = unpack_features(data)
+  return {'type':'FeatureCollection','features':to_features(packed)},tuple(packed['bounds'].tolist())
@@ -0,0 +1,131 @@
+import json
+import re
+import sys
+import tracemalloc
+import numpy as np
+
+# フィーチャーの先頭
+feature_re = re.compile(r'\{\s*"type"\s*:\s*"Feature"\s*,')
+properties_re = re.compile(r'"properties"\s*:\s*\{')
+geometry_re = re.compile(r'"geometry"\s*:\s*\{')
+coordinates_re = re.compile(r'"coordinates"\s*:\s*')
+geometry_type_re = re.compile(r'"type"\s*:\s*"(\w+)"')
+# 座標の値(括弧と数値だけからなる入れ子の配列)と、その中の数値
+coordinates_value_re = re.compile(r'\[[\[\]\d\s,.eE+-]*\]')
+number_re = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][+-]?\d+)?')
+
+decoder = json.JSONDecoder()
+
+def _peek_properties(text,start,end) :
+  # properties の type と class だけを、フィーチャー全体を復号せずに取り出す
+  m = properties_re.search(text,start,end)
+  if(m is None) :
+    return None,None
+  # properties のオブジェクトだけを復号する(入れ子のオブジェクトがあってもよい)
+  props,props_end = decoder.raw_decode(text,m.end() - 1)
+  if(props_end > end or not isinstance(props,dict)) :
+    return None,None
+  return props.get('type'),props.get('class')
+
+def _skipped_bounds(text,start,end) :
+  # 除外したフィーチャーの座標は数値の配列として範囲だけを求める
+  m = geometry_re.search(text,start,end)
+  if(m is None) :
+    return None
+  t = geometry_type_re.search(text,m.end(),end)
+  if(t is None or t.group(1) not in ('LineString','Point')) :
+    return None
+  c = coordinates_re.search(text,m.end(),end)
+  if(c is None) :
+    return None
+  v = coordinates_value_re.match(text,c.end(),end)
+  if(v is None) :
+    return None
+  co = np.array(number_re.findall(v.group(0)),dtype=np.float64)
+  if(len(co) % 2 != 0) :
+    return None
+  co = co.reshape(-1,2)
+  if(len(co) == 0) :
+    return None
+  return co[:,0].min(),co[:,0].max(),co[:,1].min(),co[:,1].max()
+
+def _feature_bounds(feature) :
+  geom = feature['geometry']
+  if(geom['type'] == 'LineString') :
+    xs = [c[0] for c in geom['coordinates']]
+    ys = [c[1] for c in geom['coordinates']]
+    return min(xs),max(xs),min(ys),max(ys)
+  elif(geom['type'] == 'Point') :
+    x,y = geom['coordinates'][0:2]
+    return x,x,y,y
+  return None
+
+def parse_fgd_tile(text,exclude_types,exclude_classes = ()) :
+  """
+  FGDタイルのGeoJSONを1フィーチャーずつ読み込み、除外するタイプ・クラスの
+  フィーチャーは座標のリストを作らずに読み飛ばす
+  Parameters
+  ----------
+  text : str
+      タイルのGeoJSON
+  exclude_types : collection of str
+      除外するフィーチャーのタイプ
+  exclude_classes : collection of str
+      除外するフィーチャーのクラス
+  Returns
+  -------
+  features : list of dict
+      残したフィーチャー
+  bounds : tuple of float
+      除外したものも含む全フィーチャー(LineStringとPoint)の範囲 (xmin, xmax, ymin, ymax)
+  """
+  exclude_types = frozenset(exclude_types)
+  exclude_classes = frozenset(exclude_classes)
+  xmax = 0.0
+  xmin = 999.
+  ymin = 999.
+  ymax = 0.
+  features_out = []
+
+  def add_bounds(b) :
+    nonlocal xmin,xmax,ymin,ymax
+    if(b is not None) :
+      xmin = min(xmin,b[0])
+      xmax = max(xmax,b[1])
+      ymin = min(ymin,b[2])
+      ymax = max(ymax,b[3])
+
+  def add_feature(feature) :
+    add_bounds(_feature_bounds(feature))
+    props = feature['properties']
+    if('type' in props and props['type'] not in exclude_types and props.get('class') not in exclude_classes) :
+      features_out.append(feature)
+
+  starts = [m.start() for m in feature_re.finditer(text)]
+  if(len(starts) == 0) :
+    # 想定外の書式の場合はまとめて読み込む
+    for feature in json.loads(text)['features'] :
+      add_feature(feature)
+  for i,start in enumerate(starts) :
+    end = starts[i + 1] if i + 1 < len(starts) else len(text)
+    feature_type,feature_class = _peek_properties(text,start,end)
+    if(feature_type in exclude_types or feature_class in exclude_classes) :
+      add_bounds(_skipped_bounds(text,start,end))
+    else :
+      add_feature(decoder.raw_decode(text,start)[0])
+  return features_out,(float(xmin),float(xmax),float(ymin),float(ymax))
+
+if __name__ == "__main__":
+  # python geojson_stream.py tile.json : json.loadとのピークメモリの比較
+  from fgd_feature_cache import exclude_types
+  with open(sys.argv[1],'r') as f :
+    text = f.read()
+  tracemalloc.start()
+  features = [f for f in json.loads(text)['features'] if 'type' in f['properties'] and f['properties']['type'] not in exclude_types]
+  peak_load = tracemalloc.get_traced_memory()[1]
+  del features
+  tracemalloc.reset_peak()
+  features,bounds = parse_fgd_tile(text,exclude_types)
+  peak_stream = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  print(f'features:{len(features)} json.load peak:{peak_load / 1e6:.2f}MB stream peak:{peak_stream / 1e6:.2f}MB')
@@ -1,12 +1,10 @@
-import gdal
-import requests
 import numpy as np
 import math
-import os
-import json
-from shapely import geometry as g
+import shapely
+from jaxa_dsm import DsmMosaic,CELL_PIXELS,NODATA,NODATA_MSK,to_global_pixel,to_lonlat
 
-jaxa_dsm_cache = {}
+# DSMは区画をつなげて必要なブロックだけ読み込む
+dsm_mosaic = DsmMosaic()
 
 def get_tile_num(lon,lat,zoom):
   # https:#wiki.openstreetmap.org/wiki/Slippy_map_tilenames#Python
@@ -17,70 +15,127 @@ def get_tile_num(lon,lat,zoom):
   return xtile, ytile
 
 def get_jaxa_dsm_height (x,y) :
-  global jaxa_dsm_cache
-  xi = int(x)
-  yi = int(y)
-  
-  key = f'N{yi:03}E{xi:03}'
-  map_data = None 
-  if(key in jaxa_dsm_cache) :
-    map_data = jaxa_dsm_cache[key]
-  else :
-    dsm_path = f'../../temp/basedata/ALPSMLC30_{key}_DSM.tif'
-    mask_path = f'../../temp/basedata/ALPSMLC30_{key}_MSK.tif'
-    dsm = gdal.Open(dsm_path,gdal.GA_ReadOnly)
-    dsm_band = dsm.GetRasterBand(1).ReadAsArray()
-    msk = gdal.Open(mask_path,gdal.GA_ReadOnly)
-    msk_band = msk.GetRasterBand(1).ReadAsArray()
-    map_data = jaxa_dsm_cache[key] = (dsm_band,msk_band)
-  x1 = int(((x-xi)) * 3600)
-  y1 = int((1 - (y - yi)) * 3600)
-  return map_data[0][y1][x1],map_data[1][y1][x1]
+  gx,gy = to_global_pixel(x,y)
+  return dsm_mosaic.read_pixel(int(gx),int(gy))
 
 
-def get_jaxa_dsm_height_rect (rect) :
-  global jaxa_dsm_cache
-
+def get_jaxa_dsm_window (rect) :
+  # 矩形の外接矩形を含むピクセルの範囲(全区画を通した位置)
   x1,y1,x2,y2 = rect.bounds
-  x1i = int(x1)
-  y1i = int(y1)
-  x2i = int(x2)
-  y2i = int(y2)
+  xs,ys = to_global_pixel(x1,y2)
+  xe = int(math.ceil(x2 * CELL_PIXELS))
+  ye = int(math.ceil((90 - y1) * CELL_PIXELS))
+  return int(xs),int(ys),max(xe,int(xs) + 1),max(ye,int(ys) + 1)
 
-  key = f'N{y1i:03}E{x1i:03}'
-  map_data = None 
-  if(key in jaxa_dsm_cache) :
-    map_data = jaxa_dsm_cache[key]
-  else :
-    dsm_path = f'../../temp/basedata/ALPSMLC30_{key}_DSM.tif'
-    mask_path = f'../../temp/basedata/ALPSMLC30_{key}_MSK.tif'
-    dsm = gdal.Open(dsm_path,gdal.GA_ReadOnly)
-    dsm_band = dsm.GetRasterBand(1).ReadAsArray()
-    msk = gdal.Open(mask_path,gdal.GA_ReadOnly)
-    msk_band = msk.GetRasterBand(1).ReadAsArray()
-    map_data = jaxa_dsm_cache[key] = (dsm_band,msk_band)
-  
-  xs = int(((x1-x1i)) * 3600)
-  ye = int(math.ceil((1 - (y1 - y1i)) * 3600))
-  xe = int(math.ceil(((x2-x2i)) * 3600))
-  ys = int((1 - (y2 - y2i)) * 3600)
+def get_jaxa_dsm_height_stats (footprint,percentiles = (50,90,95),valid_msk = (0,)) :
+  """
+  建物の形状に含まれるピクセルのDSMの高さの統計量を求める。
+  ピクセルの中心が形状に含まれるものを対象とし、MSKが無効を示すピクセルは除く
+  Parameters
+  ----------
+  footprint : Polygon
+      建物の形状(経緯度)
+  percentiles : tuple of float
+      求めるパーセンタイル
+  valid_msk : tuple of int
+      有効とみなすMSKの値
+  Returns
+  -------
+  stats : dict
+      'max','median','percentiles'(パーセンタイルと値の辞書),'count'(対象のピクセル数)。
+      有効なピクセルが無い場合は形状の重心のピクセルの値を使い、
+      重心もデータが無い(区画のファイルが無い)場合は NaN
+  """
+  # 区画の境界をまたぐ場合もつなげた範囲を読む
+  xs,ys,xe,ye = get_jaxa_dsm_window(footprint)
+  dsm,msk = dsm_mosaic.read_window(xs,ys,xe,ye)
+  # ピクセルの中心の経緯度
+  lon,lat = to_lonlat(np.arange(xs,xe),np.arange(ys,ye))
+  inside = shapely.contains_xy(footprint,lon[None,:],lat[:,None])
+  heights = dsm[inside & np.isin(msk,valid_msk) & (dsm != NODATA)].astype(np.float64)
+  if(heights.size == 0) :
+    c = footprint.centroid
+    heights = _nodata_to_nan(*get_jaxa_dsm_height(c.x,c.y))[None]
+  values = np.percentile(heights,(50,) + tuple(percentiles))
+  return {
+    'max':heights.max(),
+    'median':values[0],
+    'percentiles':dict(zip(percentiles,values[1:])),
+    'count':int(heights.size)
+  }
 
-  
-  if(xs > xe) : 
-    xs = xe
+def _nodata_to_nan (dsm,msk) :
+  # データの無いピクセルの高さを NaN にする
+  dsm = np.asarray(dsm,dtype=np.float64)
+  return np.where((dsm == NODATA) | (np.asarray(msk) == NODATA_MSK),np.nan,dsm)
+
+def get_jaxa_dsm_height_rect (rect) :
+  # 矩形に含まれるピクセルの最大の高さ
+  return get_jaxa_dsm_height_stats(rect)['max']
 
-  if(ys > ye) :
-    ys = ye
+def get_jaxa_dsm_heights (lon,lat) :
+  """
+  複数の地点のDSMの高さをまとめて求める
+  Parameters
+  ----------
+  lon, lat : array_like of float
+      経度と緯度
+  Returns
+  -------
+  heights : ndarray
+      DSMの高さ
+  msk : ndarray
+      MSKの値
+  """
+  gx,gy = to_global_pixel(lon,lat)
+  return dsm_mosaic.sample(gx,gy)
 
-  h = None
+def get_jaxa_dsm_heights_rect (rects,valid_msk = (0,)) :
+  """
+  複数の矩形(建物の形状)について、形状に含まれる有効なピクセルの最大の高さを
+  まとめて求める(get_jaxa_dsm_height_rect の一括版)
+  Parameters
+  ----------
+  rects : array_like of Geometry
+      矩形の配列
+  valid_msk : tuple of int
+      有効とみなすMSKの値
+  Returns
+  -------
+  heights : ndarray of float
+      最大の高さ。有効なピクセルが無い場合は重心のピクセルの値。
+      重心もデータが無い(区画のファイルが無い)場合は NaN
+  masked : ndarray of bool
+      有効なピクセルが形状に含まれていたかどうか
+  """
+  rects = np.asarray(rects,dtype=object)
+  n = len(rects)
+  if(n == 0) :
+    return np.empty(0),np.empty(0,dtype=bool)
+  bounds = shapely.bounds(rects)
+  xs,ys = to_global_pixel(bounds[:,0],bounds[:,3])
+  xe = np.maximum(np.ceil(bounds[:,2] * CELL_PIXELS).astype(np.int64),xs + 1)
+  ye = np.maximum(np.ceil((90 - bounds[:,1]) * CELL_PIXELS).astype(np.int64),ys + 1)
+  w,h = xe - xs,ye - ys
 
-  for x in range(xs,xe,1) :
-    for y in range(ys,ye,1) :
-        hc = map_data[0][y][x]  
-        h = max(h,hc) if h != None else hc
-  return h if h != None else map_data[0][ys][xs]
+  # 全ての矩形の範囲のピクセルを1列に並べる
+  counts = w * h
+  index = np.repeat(np.arange(n),counts)
+  k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,counts)
+  gx = xs[index] + k % w[index]
+  gy = ys[index] + k // w[index]
+  dsm,msk = dsm_mosaic.sample(gx,gy)
+  lon,lat = to_lonlat(gx,gy)
+  valid = shapely.contains_xy(rects[index],lon,lat) & np.isin(msk,valid_msk) & (dsm != NODATA)
 
-dem_cache = {}
+  heights = np.full(n,-np.inf)
+  np.maximum.at(heights,index[valid],dsm[valid].astype(np.float64))
+  masked = np.isfinite(heights)
+  if(not masked.all()) :
+    # 有効なピクセルが無いものは重心のピクセルの値を使う
+    centroids = shapely.get_coordinates(shapely.centroid(rects[~masked]))
+    heights[~masked] = _nodata_to_nan(*get_jaxa_dsm_heights(centroids[:,0],centroids[:,1]))
+  return heights,masked
 
 if __name__ == "__main__":
   #print(get_dem_height(135.182647705078,34.688277852776))
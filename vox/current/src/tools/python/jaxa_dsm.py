@@ -0,0 +1,371 @@
+import collections
+import glob
+from multiprocessing import shared_memory
+import os
+import re
+import sys
+import numpy as np
+
+# ALPSMLC30のファイルを置くディレクトリ
+basedata_dir = '../../temp/basedata/'
+
+def get_memmap_path(key,path = basedata_dir) :
+  # DSMとMSKを変換した配列ファイルのパス
+  return f'{path}ALPSMLC30_{key}.npy'
+
+def open_geotiffs(key,path = basedata_dir) :
+  # 区画のDSMとMSKのGeoTIFFを開く(データは読まない)。
+  # 変換済みの配列ファイルだけを読む場合にGDALを必要としないように、ここで読み込む
+  import gdal
+  return gdal.Open(f'{path}ALPSMLC30_{key}_DSM.tif',gdal.GA_ReadOnly),gdal.Open(f'{path}ALPSMLC30_{key}_MSK.tif',gdal.GA_ReadOnly)
+
+def convert_to_memmap(key,path = basedata_dir) :
+  """
+  区画のDSMとMSKのGeoTIFFを、メモリマップで読める非圧縮の配列ファイル
+  (.npy, int16, 形状 (2, 行数, 列数)。0がDSM、1がMSK)に変換する
+  Returns
+  -------
+  out_path : str
+      変換した配列ファイルのパス
+  """
+  dsm,msk = open_geotiffs(key,path)
+  if(dsm is None or msk is None) :
+    raise IOError(f'ALPSMLC30_{key} not found in {path}')
+  out_path = get_memmap_path(key,path)
+  # 書き込み途中のファイルを読まないように別名で書いてから置き換える
+  tmp_path = out_path + '.tmp'
+  out = np.lib.format.open_memmap(tmp_path,mode='w+',dtype=np.int16,shape=(2,dsm.RasterYSize,dsm.RasterXSize))
+  out[0] = dsm.GetRasterBand(1).ReadAsArray()
+  out[1] = msk.GetRasterBand(1).ReadAsArray()
+  out.flush()
+  del out
+  os.replace(tmp_path,out_path)
+  return out_path
+
+class DsmReader :
+  """
+  JAXA ALPSMLC30 のDSMとMSKを、必要なブロックだけ読み込んで返す。
+  読み込んだブロックは件数に上限のあるLRUキャッシュに保持するので、
+  メモリの使用量は触れた1度区画の数ではなく参照する範囲の広さで決まる。
+  convert_to_memmap で変換した配列ファイルがある区画はメモリマップで、
+  add_array で共有メモリの配列を登録した区画はその配列から読む
+  """
+  def __init__(self,path = basedata_dir,block_size = 256,max_blocks = 256) :
+    """
+    Parameters
+    ----------
+    path : str
+        ALPSMLC30_N###E###_DSM.tif, _MSK.tif を置くディレクトリ
+    block_size : int
+        1ブロックの辺のピクセル数
+    max_blocks : int
+        キャッシュに保持するブロックの最大数
+    """
+    self.path = path
+    self.block_size = block_size
+    self.max_blocks = max_blocks
+    self.datasets = {}
+    self.memmaps = {}
+    self.blocks = collections.OrderedDict()
+    self.reads = 0
+
+  def _memmap(self,key) :
+    # 登録済みの配列か、変換済みの配列ファイルがあればメモリマップで開く
+    if(key not in self.memmaps) :
+      path = get_memmap_path(key,self.path)
+      self.memmaps[key] = np.load(path,mmap_mode='r') if os.path.exists(path) else None
+    return self.memmaps[key]
+
+  def add_array(self,key,array) :
+    # 区画のDSMとMSKを (2, 行数, 列数) の配列として登録する
+    self.memmaps[key] = array
+
+  def _open(self,key) :
+    # 区画のDSMとMSKのバンドを開く(データは読まない)
+    if(key not in self.datasets) :
+      dsm,msk = open_geotiffs(key,self.path)
+      if(dsm is None or msk is None) :
+        raise IOError(f'ALPSMLC30_{key} not found in {self.path}')
+      self.datasets[key] = (dsm,msk)
+    return self.datasets[key]
+
+  def _block(self,key,bx,by) :
+    # ブロックを読み込む。キャッシュにあれば最近使ったものとして先頭に戻す
+    mm = self._memmap(key)
+    if(mm is not None) :
+      # メモリマップはOSのページキャッシュに任せるのでキャッシュしない
+      b = self.block_size
+      return mm[0,by * b:(by + 1) * b,bx * b:(bx + 1) * b],mm[1,by * b:(by + 1) * b,bx * b:(bx + 1) * b]
+    block_key = (key,bx,by)
+    block = self.blocks.get(block_key)
+    if(block is not None) :
+      self.blocks.move_to_end(block_key)
+      return block
+    dsm,msk = self._open(key)
+    xoff = bx * self.block_size
+    yoff = by * self.block_size
+    xsize = min(self.block_size,dsm.RasterXSize - xoff)
+    ysize = min(self.block_size,dsm.RasterYSize - yoff)
+    block = (dsm.GetRasterBand(1).ReadAsArray(xoff,yoff,xsize,ysize),
+             msk.GetRasterBand(1).ReadAsArray(xoff,yoff,xsize,ysize))
+    self.reads += 1
+    self.blocks[block_key] = block
+    while(len(self.blocks) > self.max_blocks) :
+      self.blocks.popitem(last=False)
+    return block
+
+  def read_window(self,key,xs,ys,xe,ye) :
+    """
+    区画内のピクセルの範囲を読み込む
+    Parameters
+    ----------
+    key : str
+        区画のキー('N035E136' など)
+    xs, ys : int
+        範囲の左上のピクセル位置
+    xe, ye : int
+        範囲の右下のピクセル位置(含まない)
+    Returns
+    -------
+    dsm : ndarray
+        DSMの高さ(ye - ys, xe - xs)
+    msk : ndarray
+        MSKの値(ye - ys, xe - xs)
+    """
+    mm = self._memmap(key)
+    if(mm is not None) :
+      width,height = mm.shape[2],mm.shape[1]
+    else :
+      dsm,_ = self._open(key)
+      width,height = dsm.RasterXSize,dsm.RasterYSize
+    xs,xe = max(xs,0),min(xe,width)
+    ys,ye = max(ys,0),min(ye,height)
+    if(xe <= xs or ye <= ys) :
+      shape = (max(ye - ys,0),max(xe - xs,0))
+      return np.empty(shape,dtype=np.int16),np.empty(shape,dtype=np.uint8)
+    if(mm is not None) :
+      return np.array(mm[0,ys:ye,xs:xe]),np.array(mm[1,ys:ye,xs:xe]).astype(np.uint8)
+    out_dsm = None
+    out_msk = None
+    b = self.block_size
+    for by in range(ys // b,(ye - 1) // b + 1) :
+      for bx in range(xs // b,(xe - 1) // b + 1) :
+        block_dsm,block_msk = self._block(key,bx,by)
+        if(out_dsm is None) :
+          out_dsm = np.empty((ye - ys,xe - xs),dtype=block_dsm.dtype)
+          out_msk = np.empty((ye - ys,xe - xs),dtype=block_msk.dtype)
+        # ブロックと範囲の重なる部分を写す
+        x0,x1 = max(xs,bx * b),min(xe,bx * b + block_dsm.shape[1])
+        y0,y1 = max(ys,by * b),min(ye,by * b + block_dsm.shape[0])
+        out_dsm[y0 - ys:y1 - ys,x0 - xs:x1 - xs] = block_dsm[y0 - by * b:y1 - by * b,x0 - bx * b:x1 - bx * b]
+        out_msk[y0 - ys:y1 - ys,x0 - xs:x1 - xs] = block_msk[y0 - by * b:y1 - by * b,x0 - bx * b:x1 - bx * b]
+    return out_dsm,out_msk
+
+  def read_pixel(self,key,x,y) :
+    # 1ピクセルのDSMとMSKの値
+    block_dsm,block_msk = self._block(key,x // self.block_size,y // self.block_size)
+    bx,by = x % self.block_size,y % self.block_size
+    return block_dsm[by][bx],block_msk[by][bx]
+
+  def cache_bytes(self) :
+    # キャッシュしているブロックのバイト数
+    return sum(d.nbytes + m.nbytes for d,m in self.blocks.values())
+
+# 1度区画あたりのピクセル数
+CELL_PIXELS = 3600
+# 区画のファイルが無い範囲の値
+NODATA = -9999
+NODATA_MSK = 255
+
+def get_cell_key(lon_cell,lat_cell) :
+  # 区画の南西端の経緯度(整数)からファイル名のキーを作る
+  return f'N{lat_cell:03}E{lon_cell:03}'
+
+def to_global_pixel(lon,lat) :
+  """
+  経緯度を全区画を通したピクセル位置に変換する。
+  列は経度0度から東へ、行は北緯90度から南へ数える
+  Returns
+  -------
+  gx, gy : int or ndarray of int
+      列と行
+  """
+  gx = np.floor(np.asarray(lon) * CELL_PIXELS).astype(np.int64)
+  gy = np.floor((90 - np.asarray(lat)) * CELL_PIXELS).astype(np.int64)
+  return gx,gy
+
+def to_lonlat(gx,gy) :
+  # ピクセルの中心の経緯度
+  return (np.asarray(gx) + 0.5) / CELL_PIXELS,90 - (np.asarray(gy) + 0.5) / CELL_PIXELS
+
+class DsmMosaic :
+  """
+  ALPSMLC30_N###E### の区画をつなげた仮想的な1枚のラスター。
+  範囲が区画の境界をまたぐ場合は、またいだ先の区画を必要になった時点で読み込む
+  """
+  def __init__(self,reader = None) :
+    self.reader = reader or DsmReader()
+    # ファイルが無かった区画
+    self.missing = set()
+
+  def read_window(self,gxs,gys,gxe,gye) :
+    """
+    全区画を通したピクセル位置の範囲を読み込む
+    Parameters
+    ----------
+    gxs, gys : int
+        範囲の左上の列と行
+    gxe, gye : int
+        範囲の右下の列と行(含まない)
+    Returns
+    -------
+    dsm : ndarray
+        DSMの高さ(gye - gys, gxe - gxs)。ファイルの無い区画は NODATA
+    msk : ndarray
+        MSKの値(gye - gys, gxe - gxs)。ファイルの無い区画は NODATA_MSK
+    """
+    shape = (max(gye - gys,0),max(gxe - gxs,0))
+    dsm = np.full(shape,NODATA,dtype=np.int16)
+    msk = np.full(shape,NODATA_MSK,dtype=np.uint8)
+    if(shape[0] == 0 or shape[1] == 0) :
+      return dsm,msk
+    n = CELL_PIXELS
+    for cy in range(gys // n,(gye - 1) // n + 1) :
+      for cx in range(gxs // n,(gxe - 1) // n + 1) :
+        key = get_cell_key(cx,89 - cy)
+        if(key in self.missing) :
+          continue
+        x0,x1 = max(gxs,cx * n),min(gxe,(cx + 1) * n)
+        y0,y1 = max(gys,cy * n),min(gye,(cy + 1) * n)
+        try :
+          d,m = self.reader.read_window(key,x0 - cx * n,y0 - cy * n,x1 - cx * n,y1 - cy * n)
+        except IOError :
+          self.missing.add(key)
+          continue
+        dsm[y0 - gys:y0 - gys + d.shape[0],x0 - gxs:x0 - gxs + d.shape[1]] = d
+        msk[y0 - gys:y0 - gys + m.shape[0],x0 - gxs:x0 - gxs + m.shape[1]] = m
+    return dsm,msk
+
+  def read_pixel(self,gx,gy) :
+    # 1ピクセルのDSMとMSKの値
+    dsm,msk = self.read_window(gx,gy,gx + 1,gy + 1)
+    return dsm[0][0],msk[0][0]
+
+  def sample(self,gx,gy) :
+    """
+    複数のピクセルの値をまとめて読む。区画内のブロックごとにまとめて添字で取り出す
+    Parameters
+    ----------
+    gx, gy : ndarray of int
+        全区画を通した列と行
+    Returns
+    -------
+    dsm : ndarray
+        DSMの高さ。ファイルの無い区画は NODATA
+    msk : ndarray
+        MSKの値。ファイルの無い区画は NODATA_MSK
+    """
+    gx = np.asarray(gx,dtype=np.int64)
+    gy = np.asarray(gy,dtype=np.int64)
+    dsm = np.full(gx.shape,NODATA,dtype=np.int16)
+    msk = np.full(gx.shape,NODATA_MSK,dtype=np.uint8)
+    if(gx.size == 0) :
+      return dsm,msk
+    n = CELL_PIXELS
+    b = self.reader.block_size
+    # 区画とブロックの番号でまとめる
+    lx,ly = gx % n,gy % n
+    groups = np.stack([gx // n,gy // n,lx // b,ly // b],axis=-1).reshape(-1,4)
+    keys,inverse = np.unique(groups,axis=0,return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse,kind='stable')
+    bounds = np.searchsorted(inverse[order],np.arange(len(keys) + 1))
+    flat_dsm = dsm.reshape(-1)
+    flat_msk = msk.reshape(-1)
+    flat_lx = lx.reshape(-1)
+    flat_ly = ly.reshape(-1)
+    for (cx,cy,bx,by),s,e in zip(keys,bounds[:-1],bounds[1:]) :
+      key = get_cell_key(int(cx),int(89 - cy))
+      if(key in self.missing) :
+        continue
+      try :
+        block_dsm,block_msk = self.reader._block(key,int(bx),int(by))
+      except IOError :
+        self.missing.add(key)
+        continue
+      i = order[s:e]
+      flat_dsm[i] = block_dsm[flat_ly[i] - by * b,flat_lx[i] - bx * b]
+      flat_msk[i] = block_msk[flat_ly[i] - by * b,flat_lx[i] - bx * b]
+    return dsm,msk
+
+class SharedDsmCells :
+  """
+  区画のDSMとMSKを共有メモリに読み込み、他のプロセスから名前で参照できるようにする。
+  ワーカーは attach_shared_cells で読み取り専用の配列として登録するので、
+  ワーカーの数が増えても区画のデータは1つだけになる
+  """
+  def __init__(self,keys,path = basedata_dir) :
+    """
+    Parameters
+    ----------
+    keys : iterable of str
+        共有する区画のキー('N035E136' など)。変換済みの配列ファイルがある区画は
+        OSのページキャッシュで共有されるので、ファイルの無い区画とともに除く
+    path : str
+        ALPSMLC30 のファイルを置くディレクトリ
+    """
+    # キー -> (共有メモリの名前, 配列の形状)
+    self.registry = {}
+    self.blocks = []
+    for key in dict.fromkeys(keys) :
+      if(os.path.exists(get_memmap_path(key,path))) :
+        continue
+      dsm,msk = open_geotiffs(key,path)
+      if(dsm is None or msk is None) :
+        continue
+      shape = (2,dsm.RasterYSize,dsm.RasterXSize)
+      shm = shared_memory.SharedMemory(create=True,size=int(np.prod(shape)) * 2)
+      array = np.ndarray(shape,dtype=np.int16,buffer=shm.buf)
+      array[0] = dsm.GetRasterBand(1).ReadAsArray()
+      array[1] = msk.GetRasterBand(1).ReadAsArray()
+      del array
+      self.blocks.append(shm)
+      self.registry[key] = (shm.name,shape)
+
+  def close(self) :
+    # 共有メモリを解放する(ワーカーの終了後に呼ぶ)
+    for shm in self.blocks :
+      shm.close()
+      shm.unlink()
+    self.blocks = []
+    self.registry = {}
+
+_attached = []
+
+def attach_shared_cells(registry,reader) :
+  """
+  SharedDsmCells で共有した区画を、読み取り専用の配列として reader に登録する
+  Parameters
+  ----------
+  registry : dict
+      SharedDsmCells.registry
+  reader : DsmReader
+      登録先
+  """
+  for key,(name,shape) in registry.items() :
+    # ワーカーは作成したプロセスのresource_trackerを共有するので、
+    # 解放は作成したプロセスの close に任せる
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape,dtype=np.int16,buffer=shm.buf)
+    array.flags.writeable = False
+    _attached.append(shm)
+    reader.add_array(key,array)
+
+if __name__ == "__main__":
+  # python jaxa_dsm.py convert [ディレクトリ] : GeoTIFFをメモリマップ用の配列ファイルに変換する
+  if(len(sys.argv) > 1 and sys.argv[1] == 'convert') :
+    path = sys.argv[2] if len(sys.argv) > 2 else basedata_dir
+    path = os.path.join(path,'')
+    for dsm_path in sorted(glob.glob(f'{path}ALPSMLC30_*_DSM.tif')) :
+      key = re.search(r'ALPSMLC30_(\w+)_DSM\.tif$',dsm_path).group(1)
+      print(convert_to_memmap(key,path))
@@ -9,148 +9,13 @@ import os
 import math
 import requests
 import re
-import cvxpy
+from tile_store import load_tile
 
 #import latlon2tile as l2t
 #from maxrect import get_intersection,get_maximal_rectangle,rect2poly
 
-def rect2poly(ll, ur):
-    """
-    Convert rectangle defined by lower left/upper right
-    to a closed polygon representation.
-    """
-    x0, y0 = ll
-    x1, y1 = ur
-
-    return [
-        [x0, y0],
-        [x0, y1],
-        [x1, y1],
-        [x1, y0],
-        [x0, y0]
-    ]
-
-
-def get_intersection(coords):
-    """Given an input list of coordinates, find the intersection
-    section of corner coordinates. Returns geojson of the
-    interesection polygon.
-    """
-    ipoly = None
-    for coord in coords:
-        if ipoly is None:
-            ipoly = Polygon(coord)
-        else:
-            tmp = Polygon(coord)
-            ipoly = ipoly.intersection(tmp)
-
-    # close the polygon loop by adding the first coordinate again
-    first_x = ipoly.exterior.coords.xy[0][0]
-    first_y = ipoly.exterior.coords.xy[1][0]
-    ipoly.exterior.coords.xy[0].append(first_x)
-    ipoly.exterior.coords.xy[1].append(first_y)
-
-    inter_coords = zip(
-        ipoly.exterior.coords.xy[0], ipoly.exterior.coords.xy[1])
-
-    inter_gj = {"geometry":
-                {"coordinates": [inter_coords],
-                 "type": "Polygon"},
-                "properties": {}, "type": "Feature"}
-
-    return inter_gj, inter_coords
-
-
-def two_pts_to_line(pt1, pt2):
-    """
-    Create a line from two points in form of
-
-    a1(x) + a2(y) = b
-    """
-    pt1 = [float(p) for p in pt1]
-    pt2 = [float(p) for p in pt2]
-    try:
-        slp = (pt2[1] - pt1[1]) / (pt2[0] - pt1[0])
-    except ZeroDivisionError:
-        slp = 1e5 * (pt2[1] - pt1[1])
-    a1 = -slp
-    a2 = 1.
-    b = -slp * pt1[0] + pt1[1]
-
-    return a1, a2, b
-
-
-def pts_to_leq(coords):
-    """
-    Converts a set of points to form Ax = b, but since
-    x is of length 2 this is like A1(x1) + A2(x2) = B.
-    returns A1, A2, B
-    """
-
-    A1 = []
-    A2 = []
-    B = []
-    for i in range(len(coords) - 1):
-        pt1 = coords[i]
-        pt2 = coords[i + 1]
-        a1, a2, b = two_pts_to_line(pt1, pt2)
-        A1.append(a1)
-        A2.append(a2)
-        B.append(b)
-    return A1, A2, B
-
-
-def get_maximal_rectangle(coordinates):
-    """
-    Find the largest, inscribed, axis-aligned rectangle.
-
-    :param coordinates:
-        A list of of [x, y] pairs describing a closed, convex polygon.
-    """
-
-    coordinates = np.array(coordinates)
-    x_range = np.max(coordinates, axis=0)[0]-np.min(coordinates, axis=0)[0]
-    y_range = np.max(coordinates, axis=0)[1]-np.min(coordinates, axis=0)[1]
-
-    scale = np.array([x_range, y_range])
-    sc_coordinates = coordinates/scale
-
-    poly = Polygon(sc_coordinates)
-    inside_pt = (poly.representative_point().x,
-                 poly.representative_point().y)
-
-    A1, A2, B = pts_to_leq(sc_coordinates)
-
-    bl = cvxpy.Variable(2)
-    tr = cvxpy.Variable(2)
-    br = cvxpy.Variable(2)
-    tl = cvxpy.Variable(2)
-    obj = cvxpy.Maximize(cvxpy.log(tr[0] - bl[0]) + cvxpy.log(tr[1] - bl[1]))
-    constraints = [bl[0] == tl[0],
-                   br[0] == tr[0],
-                   tl[1] == tr[1],
-                   bl[1] == br[1],
-                   ]
-
-    for i in range(len(B)):
-        if inside_pt[0] * A1[i] + inside_pt[1] * A2[i] <= B[i]:
-            constraints.append(bl[0] * A1[i] + bl[1] * A2[i] <= B[i])
-            constraints.append(tr[0] * A1[i] + tr[1] * A2[i] <= B[i])
-            constraints.append(br[0] * A1[i] + br[1] * A2[i] <= B[i])
-            constraints.append(tl[0] * A1[i] + tl[1] * A2[i] <= B[i])
-
-        else:
-            constraints.append(bl[0] * A1[i] + bl[1] * A2[i] >= B[i])
-            constraints.append(tr[0] * A1[i] + tr[1] * A2[i] >= B[i])
-            constraints.append(br[0] * A1[i] + br[1] * A2[i] >= B[i])
-            constraints.append(tl[0] * A1[i] + tl[1] * A2[i] >= B[i])
-
-    prob = cvxpy.Problem(obj, constraints)
-    prob.solve()
-    bottom_left = np.array(bl.value).T * scale
-    top_right = np.array(tr.value).T * scale
-
-    return ((bottom_left[0],top_right[1]),tuple(bottom_left), (top_right[0],bottom_left[1]),tuple(top_right),(bottom_left[0],top_right[1]))
+# 凸包の最大の内接矩形(辺の数ごとに一度だけ作った問題を使い回す)
+from maxrect import get_maximal_rectangle_cvxpy as get_maximal_rectangle
 
 # データとして除外するタイプ
 exclude_types = np.array([
@@ -234,15 +99,7 @@ for point_pair in point_pairs :
         map_name = f'{x}_{y}'
         map = None
         if(map_name not in maps) :
-          cache_file = f'{work_dir}cache/fgd/fgd{x}_{y}.json'
-          if(os.path.exists(cache_file)) :
-            map = json.load(open(cache_file,'r'))
-          else :
-            map_text = requests.get(f'https://cyberjapandata.gsi.go.jp/xyz/experimental_fgd/18/{x}/{y}.geojson').text
-            map = json.loads(map_text)
-            # cache fileとして保存
-            with open(cache_file,mode="w") as f:
-              f.write(map_text)
+          map = load_tile('fgd',x,y)
           maps[map_name] = map
           # 不要な featureを除去する
           features = map['features']
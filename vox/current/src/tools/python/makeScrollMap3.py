@@ -9,13 +9,13 @@ import os
 import math
 import requests
 import re
-import cvxpy
 from itertools import islice
 import time
+from tile_store import load_tile
 start = time.time()
 
 #import latlon2tile as l2t
-#from maxrect import get_intersection,get_maximal_rectangle,rect2poly
+from maxrect import search_maximal_rotated_rectangle
 
 
 def minimum_rotated_rectangle(rect):
@@ -44,144 +44,6 @@ def minimum_rotated_rectangle(rect):
     return affinity.rotate(transf_rect, inv_rad,'center',use_radians=True)
 
 
-def rect2poly(ll, ur):
-    """
-    Convert rectangle defined by lower left/upper right
-    to a closed polygon representation.
-    """
-    x0, y0 = ll
-    x1, y1 = ur
-
-    return [
-        [x0, y0],
-        [x0, y1],
-        [x1, y1],
-        [x1, y0],
-        [x0, y0]
-    ]
-
-
-def get_intersection(coords):
-    """Given an input list of coordinates, find the intersection
-    section of corner coordinates. Returns geojson of the
-    interesection polygon.
-    """
-    ipoly = None
-    for coord in coords:
-        if ipoly is None:
-            ipoly = Polygon(coord)
-        else:
-            tmp = Polygon(coord)
-            ipoly = ipoly.intersection(tmp)
-
-    # close the polygon loop by adding the first coordinate again
-    first_x = ipoly.exterior.coords.xy[0][0]
-    first_y = ipoly.exterior.coords.xy[1][0]
-    ipoly.exterior.coords.xy[0].append(first_x)
-    ipoly.exterior.coords.xy[1].append(first_y)
-
-    inter_coords = zip(
-        ipoly.exterior.coords.xy[0], ipoly.exterior.coords.xy[1])
-
-    inter_gj = {"geometry":
-                {"coordinates": [inter_coords],
-                 "type": "Polygon"},
-                "properties": {}, "type": "Feature"}
-
-    return inter_gj, inter_coords
-
-
-def two_pts_to_line(pt1, pt2):
-    """
-    Create a line from two points in form of
-
-    a1(x) + a2(y) = b
-    """
-    pt1 = [float(p) for p in pt1]
-    pt2 = [float(p) for p in pt2]
-    try:
-        slp = (pt2[1] - pt1[1]) / (pt2[0] - pt1[0])
-    except ZeroDivisionError:
-        slp = 1e5 * (pt2[1] - pt1[1])
-    a1 = -slp
-    a2 = 1.
-    b = -slp * pt1[0] + pt1[1]
-
-    return a1, a2, b
-
-
-def pts_to_leq(coords):
-    """
-    Converts a set of points to form Ax = b, but since
-    x is of length 2 this is like A1(x1) + A2(x2) = B.
-    returns A1, A2, B
-    """
-
-    A1 = []
-    A2 = []
-    B = []
-    for i in range(len(coords) - 1):
-        pt1 = coords[i]
-        pt2 = coords[i + 1]
-        a1, a2, b = two_pts_to_line(pt1, pt2)
-        A1.append(a1)
-        A2.append(a2)
-        B.append(b)
-    return A1, A2, B
-
-
-def get_maximal_rectangle(coordinates):
-    """
-    Find the largest, inscribed, axis-aligned rectangle.
-
-    :param coordinates:
-        A list of of [x, y] pairs describing a closed, convex polygon.
-    """
-
-    coordinates = np.array(coordinates)
-    x_range = np.max(coordinates, axis=0)[0]-np.min(coordinates, axis=0)[0]
-    y_range = np.max(coordinates, axis=0)[1]-np.min(coordinates, axis=0)[1]
-
-    scale = np.array([x_range, y_range])
-    sc_coordinates = coordinates/scale
-
-    poly = Polygon(sc_coordinates)
-    inside_pt = (poly.representative_point().x,
-                 poly.representative_point().y)
-
-    A1, A2, B = pts_to_leq(sc_coordinates)
-
-    bl = cvxpy.Variable(2)
-    tr = cvxpy.Variable(2)
-    br = cvxpy.Variable(2)
-    tl = cvxpy.Variable(2)
-    obj = cvxpy.Maximize(cvxpy.log(tr[0] - bl[0]) + cvxpy.log(tr[1] - bl[1]))
-    constraints = [bl[0] == tl[0],
-                   br[0] == tr[0],
-                   tl[1] == tr[1],
-                   bl[1] == br[1],
-                   ]
-
-    for i in range(len(B)):
-        if inside_pt[0] * A1[i] + inside_pt[1] * A2[i] <= B[i]:
-            constraints.append(bl[0] * A1[i] + bl[1] * A2[i] <= B[i])
-            constraints.append(tr[0] * A1[i] + tr[1] * A2[i] <= B[i])
-            constraints.append(br[0] * A1[i] + br[1] * A2[i] <= B[i])
-            constraints.append(tl[0] * A1[i] + tl[1] * A2[i] <= B[i])
-
-        else:
-            constraints.append(bl[0] * A1[i] + bl[1] * A2[i] >= B[i])
-            constraints.append(tr[0] * A1[i] + tr[1] * A2[i] >= B[i])
-            constraints.append(br[0] * A1[i] + br[1] * A2[i] >= B[i])
-            constraints.append(tl[0] * A1[i] + tl[1] * A2[i] >= B[i])
-
-    prob = cvxpy.Problem(obj, constraints)
-    prob.solve(verbose=False, max_iters=1000, reltol=1e-9)
-    bottom_left = np.array(bl.value).T * scale
-    top_right = np.array(tr.value).T * scale
-
-    return ((bottom_left[0],top_right[1]),tuple(bottom_left), (top_right[0],bottom_left[1]),tuple(top_right),(bottom_left[0],top_right[1]))
-
 # データとして除外するタイプ
 exclude_types = np.array([
   '一般等高線',
@@ -211,7 +73,6 @@ exclude_types = np.array([
   '三角点'
 ])
 
-rad_range = np.arange(0., math.pi, math.pi / 64.)
 
 def get_tile_num(coords,zoom):
   # https:#wiki.openstreetmap.org/wiki/Slippy_map_tilenames#Python
@@ -266,15 +127,7 @@ for point_pair in point_pairs :
         map_name = f'{x}_{y}'
         map = None
         if(map_name not in maps) :
-          cache_file = f'{work_dir}cache/fgd/fgd{x}_{y}.json'
-          if(os.path.exists(cache_file)) :
-            map = json.load(open(cache_file,'r'))
-          else :
-            map_text = requests.get(f'https://cyberjapandata.gsi.go.jp/xyz/experimental_fgd/18/{x}/{y}.geojson').text
-            map = json.loads(map_text)
-            # cache fileとして保存
-            with open(cache_file,mode="w") as f:
-              f.write(map_text)
+          map = load_tile('fgd',x,y)
           maps[map_name] = map
           # 不要な featureを除去する
           features = map['features']
@@ -381,31 +234,14 @@ for fid in fids.values() :
       unsuitable_results.append(coords)
       print(target_fid)
       try :
-        result = None
-        result_rad = 0.
-        for rad in rad_range :
-          rotated_polygon = affinity.rotate(mp,rad,'centroid',use_radians=True)
-          answer = Polygon(get_maximal_rectangle(geometry.mapping(rotated_polygon)['coordinates'][0]))
-          if(result == None) : 
-            result = answer
-            result_rad = rad
-          else :
-            if(answer.area > result.area) :
-              result = answer 
-              result_rad = rad
-          
-        # 逆回転させる
+        # 辺の向きと粗い角度から始めて、最良の角度の周りを絞り込んで最大の内接矩形を求める
+        result,result_rad = search_maximal_rotated_rectangle(mp)
         if(result == None) :
           rect = simplize_1()
           rect = geometry.mapping(rect)['coordinates'][0]
         else :
-          result = affinity.rotate(result,-result_rad,'centroid',use_radians=True)
-          x1,y1 = result.centroid.xy
-          x2,y2 = target.centroid.xy
-          x1,y1 = x1[0],y1[0]
-          x2,y2 = x2[0],y2[0]
-          rect = affinity.translate(result,x2-x1,y2-y1)          
-          rect = geometry.mapping(rect)['coordinates'][0]
+          # 内接矩形は建物の座標で求まっているので、そのまま使う
+          rect = geometry.mapping(result)['coordinates'][0]
       except Exception as e :
         rect = simplized_rect
         rect = geometry.mapping(rect)['coordinates'][0]
@@ -12,6 +12,8 @@ import re
 import cvxpy
 from itertools import islice
 import time
+from tile_store import load_tile
+from batch_simplify import simplize_rects
 start = time.time()
 
 #import latlon2tile as l2t
@@ -266,15 +268,7 @@ for point_pair in point_pairs :
         map_name = f'{x}_{y}'
         map = None
         if(map_name not in maps) :
-          cache_file = f'{work_dir}cache/fgd/fgd{x}_{y}.json'
-          if(os.path.exists(cache_file)) :
-            map = json.load(open(cache_file,'r'))
-          else :
-            map_text = requests.get(f'https://cyberjapandata.gsi.go.jp/xyz/experimental_fgd/18/{x}/{y}.geojson').text
-            map = json.loads(map_text)
-            # cache fileとして保存
-            with open(cache_file,mode="w") as f:
-              f.write(map_text)
+          map = load_tile('fgd',x,y)
           maps[map_name] = map
           # 不要な featureを除去する
           features = map['features']
@@ -327,6 +321,7 @@ for point_pair in point_pairs :
       #   print(f'not contain:{b}')
 
 # 分割された建物データを結合し、矩形に単純化する
+targets = []
 for fid in fids.values() :
   coords = fid[0]['feature']['geometry']['coordinates']
   target_fid = fid[0]['feature']['properties']['fid']
@@ -339,61 +334,20 @@ for fid in fids.values() :
   else :
     mp = geometry.LineString(coords)
   
-  target = mp
-  convex_hull = mp.convex_hull
-
-  def simplize_1(target) :
-    rect = target.minimum_rotated_rectangle
-    convex_hull = target.convex_hull
-
-    x1,y1 = rect.centroid.xy
-    x2,y2 = target.centroid.xy
-    x1,y1 = x1[0],y1[0]
-    x2,y2 = x2[0],y2[0]
-
-    translated_rect = affinity.translate(rect,x2-x1,y2-y1)
-    rates = np.empty(0)
-    min_rate = None
-    for pt in translated_rect.exterior.coords :
-      lst = geometry.LineString((pt,(x2,y2)))
-      intersects = convex_hull.intersection(lst)
-      if(intersects.type == 'MultiLineString') :
-        for i in intersects :
-          rates = np.append(rates,i.length / lst.length)
-          # if(min_rate == None) : 
-          #     min_rate = i.length / lst.length)
-          # else :
-          #     min_rate = min(min_rate,i.length / lst.length)
-
-      else :    
-          rates = np.append(rates,intersects.length / lst.length)
-        # if(min_rate == None) : 
-        #     min_rate = intersects.length / lst.length
-        #   #     min_rate = i.length / lst.length)
-        # else :
-        #     min_rate = min(min_rate,intersects.length / lst.length)
-
-    rates = np.unique(rates)
-    shrinked_rect = None
-    for rate in rates :
-      rect_s = affinity.scale(translated_rect,rate,rate,1.0,(x2,y2))
-      if convex_hull.contains(rect_s) : 
-        shrinked_rect = rect_s if shrinked_rect == None else max(rect_s,shrinked_rect,key=lambda r:r.area) 
-    
-    shrinked_rect = affinity.scale(translated_rect,np.min(rates),np.min(rates),1.0,(x2,y2))  if shrinked_rect == None else shrinked_rect
-    #shrinked_rect = affinity.scale(translated_rect,min_rate,min_rate,1.0,(x2,y2))
-    rect = geometry.mapping(shrinked_rect)['coordinates'][0]
-    return rect,shrinked_rect
- 
+  targets.append((fid,mp))
+
+# 矩形への単純化はまとめて行う
+shrinked_rects,tg_cv_rates,tg_min_rates = simplize_rects([target for _,target in targets])
+
+for (fid,target),shrinked_rect,tg_cv_rate,tg_min_rate in zip(targets,shrinked_rects,tg_cv_rates,tg_min_rates) :
   try :
-    # if(convex_hull.area == 0 or ((mp.area / convex_hull.area) > 0.7)) :
-    #   rect = simplize_1(convex_hull)
-    # else :
-    rect,shrinked_rect = simplize_1(target)
+    if(shrinked_rect is None) :
+      raise ValueError(f"cannot simplize:{fid[0]['feature']['properties']['fid']}")
+    rect = geometry.mapping(shrinked_rect)['coordinates'][0]
 
     fid[0]['feature']['geometry']['coordinates'] = rect
-    fid[0]['feature']['properties']['tg_cv_rate'] = (target.area / target.convex_hull.area) if target.convex_hull.area > 0 else 0
-    fid[0]['feature']['properties']['tg_min_rate'] = (shrinked_rect.area / target.area) if target.area > 0 else 0
+    fid[0]['feature']['properties']['tg_cv_rate'] = float(tg_cv_rate)
+    fid[0]['feature']['properties']['tg_min_rate'] = float(tg_min_rate)
   except Exception as e:
     print(e)
     #fid[0]['feature']['geometry']['coordinates'] = geometry.mapping(target.minimum_rotated_rectangle)['coordinates'][0]
@@ -10,6 +10,7 @@ import math
 import requests
 import re
 import cvxpy
+from tile_store import load_tile
 
 #import latlon2tile as l2t
 #from maxrect import get_intersection,get_maximal_rectangle,rect2poly
@@ -234,15 +235,7 @@ for point_pair in point_pairs :
         map_name = f'{x}_{y}'
         map = None
         if(map_name not in maps) :
-          cache_file = f'{work_dir}cache/fgd/fgd{x}_{y}.json'
-          if(os.path.exists(cache_file)) :
-            map = json.load(open(cache_file,'r'))
-          else :
-            map_text = requests.get(f'https://cyberjapandata.gsi.go.jp/xyz/experimental_fgd/18/{x}/{y}.geojson').text
-            map = json.loads(map_text)
-            # cache fileとして保存
-            with open(cache_file,mode="w") as f:
-              f.write(map_text)
+          map = load_tile('fgd',x,y)
           maps[map_name] = map
           # 不要な featureを除去する
           features = map['features']
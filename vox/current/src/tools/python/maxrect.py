@@ -0,0 +1,652 @@
+import math
+import sys
+import time
+import numpy as np
+import cvxpy
+from shapely import affinity
+from shapely.geometry import Polygon
+
+
+def rect2poly(ll, ur):
+    """
+    Convert rectangle defined by lower left/upper right
+    to a closed polygon representation.
+    """
+    x0, y0 = ll
+    x1, y1 = ur
+
+    return [
+        [x0, y0],
+        [x0, y1],
+        [x1, y1],
+        [x1, y0],
+        [x0, y0]
+    ]
+
+
+def get_intersection(coords):
+    """Given an input list of coordinates, find the intersection
+    section of corner coordinates. Returns geojson of the
+    interesection polygon.
+    """
+    ipoly = None
+    for coord in coords:
+        if ipoly is None:
+            ipoly = Polygon(coord)
+        else:
+            tmp = Polygon(coord)
+            ipoly = ipoly.intersection(tmp)
+
+    # close the polygon loop by adding the first coordinate again
+    first_x = ipoly.exterior.coords.xy[0][0]
+    first_y = ipoly.exterior.coords.xy[1][0]
+    ipoly.exterior.coords.xy[0].append(first_x)
+    ipoly.exterior.coords.xy[1].append(first_y)
+
+    inter_coords = zip(
+        ipoly.exterior.coords.xy[0], ipoly.exterior.coords.xy[1])
+
+    inter_gj = {"geometry":
+                {"coordinates": [inter_coords],
+                 "type": "Polygon"},
+                "properties": {}, "type": "Feature"}
+
+    return inter_gj, inter_coords
+
+
+def two_pts_to_line(pt1, pt2):
+    """
+    Create a line from two points in form of
+
+    a1(x) + a2(y) = b
+    """
+    pt1 = [float(p) for p in pt1]
+    pt2 = [float(p) for p in pt2]
+    try:
+        slp = (pt2[1] - pt1[1]) / (pt2[0] - pt1[0])
+    except ZeroDivisionError:
+        slp = 1e5 * (pt2[1] - pt1[1])
+    a1 = -slp
+    a2 = 1.
+    b = -slp * pt1[0] + pt1[1]
+
+    return a1, a2, b
+
+
+def pts_to_leq(coords):
+    """
+    Converts a set of points to form Ax = b, but since
+    x is of length 2 this is like A1(x1) + A2(x2) = B.
+    returns A1, A2, B
+    """
+
+    A1 = []
+    A2 = []
+    B = []
+    for i in range(len(coords) - 1):
+        pt1 = coords[i]
+        pt2 = coords[i + 1]
+        a1, a2, b = two_pts_to_line(pt1, pt2)
+        A1.append(a1)
+        A2.append(a2)
+        B.append(b)
+    return A1, A2, B
+
+
+class MaximalRectangleProblems:
+    """
+    get_maximal_rectangle_cvxpy の問題を辺の数ごとに一度だけ作って使い回す。
+    各辺の直線 A1 x + A2 y = B に内部の点の側の符号を掛けた係数を Parameter にして
+    すべての制約を A @ corner <= b の形にする(DPP)ので、2回目以降は
+    Parameter の値を入れ替えるだけで正準化をやり直さずに解ける
+    """
+
+    def __init__(self):
+        self.problems = {}
+
+    def get(self, edges):
+        # 辺の数 edges の問題と (A, b, 左下, 右上) を返す
+        if edges not in self.problems:
+            A = cvxpy.Parameter((edges, 2))
+            b = cvxpy.Parameter(edges)
+            bl = cvxpy.Variable(2)
+            tr = cvxpy.Variable(2)
+            obj = cvxpy.Maximize(cvxpy.log(tr[0] - bl[0]) + cvxpy.log(tr[1] - bl[1]))
+            # 左下・右上・右下・左上の4頂点がすべての半平面に入る
+            constraints = [A @ bl <= b,
+                           A @ tr <= b,
+                           cvxpy.multiply(A[:, 0], tr[0]) + cvxpy.multiply(A[:, 1], bl[1]) <= b,
+                           cvxpy.multiply(A[:, 0], bl[0]) + cvxpy.multiply(A[:, 1], tr[1]) <= b]
+            self.problems[edges] = (cvxpy.Problem(obj, constraints), A, b, bl, tr)
+        return self.problems[edges]
+
+    def solve(self, coordinates):
+        coordinates = np.array(coordinates)
+        scale = coordinates.max(axis=0) - coordinates.min(axis=0)
+        sc_coordinates = coordinates / scale
+
+        inside_pt = np.array(Polygon(sc_coordinates).representative_point().coords[0])
+        A1, A2, B = pts_to_leq(sc_coordinates)
+        lines = np.column_stack([A1, A2])
+        B = np.array(B)
+        # 内部の点と反対側が正になる向きに揃える
+        side = np.where(lines @ inside_pt <= B, 1., -1.)
+
+        prob, A, b, bl, tr = self.get(len(B))
+        A.value = lines * side[:, None]
+        b.value = B * side
+        prob.solve(verbose=False, warm_start=True, max_iters=1000, reltol=1e-9)
+        bottom_left = np.array(bl.value).T * scale
+        top_right = np.array(tr.value).T * scale
+        return ((bottom_left[0], top_right[1]), tuple(bottom_left), (top_right[0], bottom_left[1]), tuple(top_right), (bottom_left[0], top_right[1]))
+
+
+_problems = MaximalRectangleProblems()
+
+
+def get_maximal_rectangle_cvxpy(coordinates):
+    """
+    Find the largest, inscribed, axis-aligned rectangle.
+
+    :param coordinates:
+        A list of of [x, y] pairs describing a closed, convex polygon.
+    """
+    return _problems.solve(coordinates)
+
+
+def _clip_halfplanes(coordinates):
+    """
+    get_maximal_rectangle_cvxpy と同じ制約(各辺を通る直線に対して内部の点と
+    同じ側)を満たす凸領域を、外接矩形を半平面で順に切り取って求める。
+    凸多角形ならその多角形自身になる
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    inside = np.array(Polygon(coordinates).representative_point().coords[0])
+    x0, y0 = coordinates.min(axis=0)
+    x1, y1 = coordinates.max(axis=0)
+    region = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    for p1, p2 in zip(coordinates[:-1], coordinates[1:]):
+        d = p2 - p1
+        if not d.any():
+            continue
+        n = np.array([-d[1], d[0]])
+        c = n @ p1
+        side = np.sign(n @ inside - c) or 1.0
+        v = side * (region @ n - c)
+        # Sutherland-Hodgman
+        clipped = []
+        for i in range(len(region)):
+            j = (i + 1) % len(region)
+            if v[i] >= 0:
+                clipped.append(region[i])
+            if (v[i] >= 0) != (v[j] >= 0):
+                clipped.append(region[i] + v[i] / (v[i] - v[j]) * (region[j] - region[i]))
+        region = np.array(clipped).reshape(-1, 2)
+        if len(region) < 3:
+            break
+    return region
+
+
+def _max_axis_rect(region, points=33, rounds=6):
+    """
+    凸多角形に内接する最大の軸平行矩形を求める。
+    凸多角形では左端 L(y) は凸、右端 R(y) は凹なので、下辺 ya と上辺 yb を
+    決めると幅は min(R(ya), R(yb)) - max(L(ya), L(yb)) で決まり、面積の対数は
+    (ya, yb) について凹になる。ya ごとに最良の yb を区間ごとの二次式から求め、
+    ya は格子の最良点の両隣まで範囲を狭めながら探す。
+    Returns
+    -------
+    rect : tuple of float
+        (面積, xmin, ymin, xmax, ymax)。求まらない場合は None
+    """
+    p1 = region
+    p2 = np.roll(region, -1, axis=0)
+    ymin, ymax = region[:, 1].min(), region[:, 1].max()
+    if ymax - ymin <= 0:
+        return None
+    dy = p2[:, 1] - p1[:, 1]
+    dx = p2[:, 0] - p1[:, 0]
+    t = np.linspace(0., 1., points)
+
+    def span(ys):
+        # 各高さでの領域の左端・右端
+        ys = ys.reshape(-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = (ys[:, None] - p1[None, :, 1]) / dy[None, :]
+            x = p1[None, :, 0] + s * dx[None, :]
+        valid = (dy[None, :] != 0) & (s >= -1e-12) & (s <= 1 + 1e-12)
+        return np.where(valid, x, np.inf).min(axis=1), np.where(valid, x, -np.inf).max(axis=1)
+
+    def best_top(ya):
+        # ya ごとに面積が最大になる yb を求める。幅は頂点の高さと、辺が
+        # x = L(ya), x = R(ya) と交わる高さの間では一次式なので、区間ごとに
+        # 面積の二次式の最大値を求める
+        la, ra = span(ya)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross = [p1[None, :, 1] + (x[:, None] - p1[None, :, 0]) / dx[None, :] * dy[None, :] for x in (la, ra)]
+        yb = np.concatenate([np.broadcast_to(region[:, 1], (len(ya), len(region))), cross[0], cross[1],
+                             np.full((len(ya), 1), ymax)], axis=1)
+        yb = np.sort(np.clip(np.nan_to_num(yb, nan=ymax, posinf=ymax, neginf=ymax), ya[:, None], ymax), axis=1)
+        lb, rb = span(yb)
+        w = np.minimum(ra[:, None], rb.reshape(yb.shape)) - np.maximum(la[:, None], lb.reshape(yb.shape))
+        y0, y1, w0, w1 = yb[:, :-1], yb[:, 1:], w[:, :-1], w[:, 1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (w1 - w0) / (y1 - y0)
+            ys = np.clip((y0 + ya[:, None]) / 2 - w0 / (2 * slope), y0, y1)
+        ws = w0 + slope * (ys - y0)
+        ys = np.concatenate([yb, np.where(np.isfinite(ws), ys, y0)], axis=1)
+        ws = np.concatenate([w, np.where(np.isfinite(ws), ws, w0)], axis=1)
+        # 幅が負の範囲は幅そのものを評価値にして単峰性を保つ
+        area = np.where(ws > 0, ws * (ys - ya[:, None]), ws)
+        j = np.argmax(area, axis=1)
+        rows = np.arange(len(ya))
+        top = ys[rows, j]
+        lb, rb = span(top)
+        return area[rows, j], np.maximum(la, lb), top, np.minimum(ra, rb)
+
+    lo, hi = ymin, ymax
+    for _ in range(rounds):
+        ya = lo + (hi - lo) * t
+        area, left, yb, right = best_top(ya)
+        i = np.argmax(area)
+        lo, hi = ya[max(i - 1, 0)], ya[min(i + 1, points - 1)]
+    if area[i] <= 0:
+        return None
+    return area[i], left[i], ya[i], right[i], yb[i]
+
+
+def get_maximal_rectangle(coordinates):
+    """
+    Find the largest, inscribed, axis-aligned rectangle without a solver.
+
+    Same constraints and return value as get_maximal_rectangle_cvxpy.
+
+    :param coordinates:
+        A list of of [x, y] pairs describing a closed, convex polygon.
+    """
+    r = _max_axis_rect(_clip_halfplanes(coordinates))
+    if r is None:
+        pt = Polygon(coordinates).representative_point()
+        x0 = x1 = pt.x
+        y0 = y1 = pt.y
+    else:
+        _, x0, y0, x1, y1 = r
+    return ((x0, y1), (x0, y0), (x1, y0), (x1, y1), (x0, y1))
+
+
+def get_hull_angles(polygon):
+    """
+    凸包の各辺の向き(rad, 0 以上 pi/2 未満)を返す
+    """
+    hull = polygon.convex_hull
+    if hull.geom_type != 'Polygon':
+        return np.empty(0)
+    d = np.diff(np.array(hull.exterior.coords), axis=0)
+    return np.unique(np.round(np.mod(np.arctan2(d[:, 1], d[:, 0]), math.pi / 2), 12))
+
+
+def get_seed_angles(polygon, max_seeds=6, tol=1e-3):
+    """
+    角度の探索の起点にする多角形の辺の向き(rad, 0 以上 pi/2 未満)を返す。
+    凸包の辺も元の多角形の辺なので、凸包の辺と平行な最小回転外接矩形の向きも含まれる。
+    凸でない場合は凹んだ部分の辺の向きが最良になることが多いので、凸包ではなく元の辺を使う。
+    tol 以内の向きはまとめ、辺の長さの合計が大きい順に max_seeds 個まで返す
+    """
+    if polygon.geom_type != 'Polygon' or polygon.convex_hull.geom_type != 'Polygon':
+        return np.empty(0)
+    d = np.diff(np.array(polygon.exterior.coords), axis=0)
+    angles = np.mod(np.arctan2(d[:, 1], d[:, 0]), math.pi / 2)
+    lengths = np.hypot(d[:, 0], d[:, 1])
+    order = np.argsort(angles)
+    angles, lengths = angles[order], lengths[order]
+    # 近い向きをまとめる(0 と pi/2 はつながっている)
+    group = np.concatenate([[0], np.cumsum(np.diff(angles) > tol)])
+    if len(angles) > 1 and angles[0] + math.pi / 2 - angles[-1] <= tol:
+        group[group == group[-1]] = 0
+    weights = np.bincount(group, lengths)
+    seeds = np.array([angles[group == g][np.argmax(lengths[group == g])] for g in range(len(weights))])
+    keep = weights > 0
+    seeds, weights = seeds[keep], weights[keep]
+    return seeds[np.argsort(-weights)[:max_seeds]]
+
+
+def _rect_at(coords, angle, center, clip):
+    # angle だけ回転させた領域の最大の軸平行矩形
+    c, s = math.cos(-angle), math.sin(-angle)
+    rotated = (coords - center) @ np.array([[c, s], [-s, c]])
+    return _max_axis_rect(_clip_halfplanes(rotated) if clip else rotated[:-1])
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Budget:
+    """
+    建物1件あたりの計算時間(秒)と計算回数(角度ごとの矩形の計算と、縮める際の判定)の上限。
+    start() で建物ごとに数え直し、check() で上限を超えたら BudgetExceeded を送出する
+    """
+
+    def __init__(self, seconds=None, iterations=None):
+        self.seconds = seconds
+        self.iterations = iterations
+        self.start()
+
+    def start(self):
+        self.deadline = time.time() + self.seconds if self.seconds is not None else None
+        self.used = 0
+        return self
+
+    def check(self):
+        self.used += 1
+        if self.iterations is not None and self.used > self.iterations:
+            raise BudgetExceeded(f'iterations exceeded: {self.iterations}')
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded(f'time exceeded: {self.seconds}[sec]')
+
+
+def _evaluator(coords, center, clip, budget=None):
+    # 角度(pi/2 で同じ向きになる)ごとの結果を覚えておき、同じ角度は解き直さない。
+    # 調べた角度の結果の辞書も返す
+    evaluated = {}
+
+    def evaluate(angle):
+        angle = float(np.mod(angle, math.pi / 2))
+        key = round(angle, 9)
+        if key not in evaluated:
+            if budget is not None:
+                budget.check()
+            evaluated[key] = (_rect_at(coords, angle, center, clip), angle)
+        return evaluated[key]
+    return evaluate, evaluated
+
+
+def _better(candidate, result):
+    return candidate[0] is not None and (result is None or candidate[0][0] > result[0][0] * (1 + 1e-9))
+
+
+def _best_rotated(evaluate, angles):
+    # 角度ごとに回転させた領域の最大の軸平行矩形のうち、最も大きいもの
+    result = None
+    for angle in angles:
+        candidate = evaluate(angle)
+        if _better(candidate, result):
+            result = candidate
+    return result
+
+
+def _search_rotated(evaluate, seeds, bound, coarse, refine, tol):
+    # seeds と coarse 等分の角度を調べ、最良の角度を両隣の候補との間で絞り込む。
+    # seeds の段階で面積が bound (矩形の面積の上限)の 1 - tol 以上になったらそれ以上は探さない
+    result = None
+    for angle in seeds:
+        candidate = evaluate(angle)
+        if _better(candidate, result):
+            result = candidate
+            if result[0][0] >= bound * (1 - tol):
+                return result
+    grid = np.arange(coarse) * (math.pi / 2 / max(coarse, 1))
+    for angle in grid:
+        candidate = evaluate(angle)
+        if _better(candidate, result):
+            result = candidate
+    if result is None:
+        return None
+
+    # 最良の角度を挟む候補の角度(pi/2 で一周する)
+    best = result[1]
+    tried = np.mod(np.concatenate([seeds, grid]) - best, math.pi / 2)
+    tried = tried[(tried > 1e-9) & (tried < math.pi / 2 - 1e-9)]
+    lo = best - min(math.pi / 2 - tried.max() if len(tried) else math.pi / 8, math.pi / 8)
+    hi = best + min(tried.min() if len(tried) else math.pi / 8, math.pi / 8)
+    # 広い方の区間の中点を調べ、良ければそこへ移り、悪ければ区間を狭める
+    for _ in range(refine):
+        angle = (lo + best) / 2 if best - lo > hi - best else (best + hi) / 2
+        candidate = evaluate(angle)
+        if _better(candidate, result):
+            result = (candidate[0], angle)
+            lo, hi = (lo, best) if angle < best else (best, hi)
+            best = angle
+        elif angle < best:
+            lo = angle
+        else:
+            hi = angle
+    return result[0], float(np.mod(result[1], math.pi / 2))
+
+
+def _to_polygon(result, center):
+    # 回転した座標の矩形を元の座標に戻す
+    (_, x0, y0, x1, y1), angle = result
+    c, s = math.cos(angle), math.sin(angle)
+    corners = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]]) @ np.array([[c, s], [-s, c]]) + center
+    return Polygon(corners)
+
+
+def _shrink_into(polygon, rect, budget=None):
+    # 元の多角形に収まるまで中心に向かって縮める
+    if polygon.contains(rect):
+        return rect
+    lo, hi = 0., 1.
+    for _ in range(16):
+        if budget is not None:
+            budget.check()
+        mid = (lo + hi) / 2
+        if polygon.contains(affinity.scale(rect, mid, mid, 1.0, 'centroid')):
+            lo = mid
+        else:
+            hi = mid
+    return affinity.scale(rect, lo, lo, 1.0, 'centroid')
+
+
+def _maximal_rotated(polygon, find, budget=None):
+    # find(evaluate, clip) で凸包と(凸でない場合は)半平面の共通部分の最良の矩形を求める
+    hull = polygon.convex_hull
+    if hull.geom_type != 'Polygon':
+        return None, 0.
+    coords = np.array(hull.exterior.coords)
+    center = coords[:-1].mean(axis=0)
+    evaluate, evaluated = _evaluator(coords, center, False, budget)
+    result = find(evaluate, False)
+    if result is None:
+        return None, 0.
+    if polygon.area >= hull.area * (1 - 1e-9):
+        return _to_polygon(result, center), result[1]
+
+    # 凸でない場合は、調べた全ての角度の矩形を多角形に収まるまで縮めて比べる。
+    # 縮める前の面積が最も大きい角度が、縮めた後も最も大きいとは限らない
+    evaluate_clipped, evaluated_clipped = _evaluator(np.array(polygon.exterior.coords), center, True, budget)
+    find(evaluate_clipped, True)
+    candidates = [c for c in list(evaluated.values()) + list(evaluated_clipped.values()) if c[0] is not None]
+    candidates.sort(key=lambda c: -c[0][0])
+    best = None
+    for candidate in candidates:
+        # 縮めると面積は減るので、縮める前の面積が最良以下の角度は調べない
+        if best is not None and candidate[0][0] <= best[0].area:
+            break
+        rect = _shrink_into(polygon, _to_polygon(candidate, center), budget)
+        if best is None or rect.area > best[0].area:
+            best = (rect, candidate[1])
+    return best
+
+
+def get_maximal_rotated_rectangle(polygon, angles=None, budget=None):
+    """
+    多角形に内接する最大の回転矩形を求める。
+    凸包に内接する矩形を角度ごとに求める。凸でない場合は
+    get_maximal_rectangle_cvxpy と同じ半平面の共通部分から求めたものと、
+    凸包から求めて多角形に収まるまで縮めたもののうち大きい方を返す
+    Parameters
+    ----------
+    polygon : Polygon
+        建物の形状
+    angles : iterable of float
+        矩形の角度(rad)の候補。省略時は凸包の各辺の向き
+    budget : Budget
+        計算時間と回数の上限。超えた場合は BudgetExceeded を送出する
+    Returns
+    -------
+    rect : Polygon
+        矩形。求まらない場合は None
+    angle : float
+        矩形の角度(rad)
+    """
+    if angles is None:
+        angles = get_hull_angles(polygon)
+    return _maximal_rotated(polygon, lambda evaluate, clip: _best_rotated(evaluate, angles), budget)
+
+
+def search_maximal_rotated_rectangle(polygon, max_seeds=4, coarse=4, refine=5, tol=1e-2, budget=None, nonconvex_coarse=16):
+    """
+    get_maximal_rotated_rectangle の角度を等間隔に並べる代わりに、
+    辺の向き(get_seed_angles)と coarse 等分の角度から始めて、最良の角度の
+    周りを refine 回絞り込む。角度ごとの計算回数は最大で
+    max_seeds + coarse + refine 回になる。
+    凸でない場合は、縮めた後の面積が角度によって大きく変わり、最良の角度の周りを
+    絞り込むだけでは等間隔の角度より小さくなることが多いので、nonconvex_coarse 等分の
+    角度で探し、半平面の共通部分の辺の向き max_seeds 個を加えてもう一度探す。
+    内接矩形の面積は多角形の面積を超えないので、辺の向きで多角形の面積の
+    1 - tol 以上になったら(ほぼ矩形の建物)そこで打ち切る。
+    pi/64 刻みの角度(get_maximal_rotated_rectangle)と比べた計算回数は、凸包では
+    約 1/4、凸でない建物では約 3/5 で、1/10 にはならない。凸でない建物の面積は
+    平均では同じだが、約1%の建物で 0.95 倍未満(最小 0.9 倍程度)になる
+    (maxrect.py の __main__ の合成した形状で計測)。
+    budget は get_maximal_rotated_rectangle と同じ
+    Returns
+    -------
+    rect : Polygon
+        矩形。求まらない場合は None
+    angle : float
+        矩形の角度(rad)
+    """
+    seeds = get_seed_angles(polygon, max_seeds)
+    hull_area = polygon.convex_hull.area
+    if polygon.area < hull_area * (1 - 1e-9):
+        coarse = max(coarse, nonconvex_coarse)
+
+    def find(evaluate, clip):
+        if not clip:
+            return _search_rotated(evaluate, seeds, hull_area, coarse, refine, tol)
+        # 半平面の共通部分の矩形は、共通部分(凸多角形)の辺の向きも起点にする
+        region = _clip_halfplanes(np.array(polygon.exterior.coords))
+        if len(region) >= 3:
+            clipped_seeds = np.concatenate([seeds, get_seed_angles(Polygon(region), max_seeds)])
+        else:
+            clipped_seeds = seeds
+        return _search_rotated(evaluate, clipped_seeds, polygon.area, coarse, refine, tol)
+    return _maximal_rotated(polygon, find, budget)
+
+
+if __name__ == "__main__":
+    # python maxrect.py [件数] : タイルストアの建物の凸包でcvxpy版と比較し、
+    # 凸でない建物の形状で角度の探索と等間隔の角度を比較する
+    from tile_store import get_store
+    from fgd_feature_cache import load_fgd_features, exclude_types
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    polygons = []
+    footprints = []
+    for layer, z, x, y in get_store().keys('fgd'):
+        map, _ = load_fgd_features(x, y, exclude_types, z)
+        for f in map['features']:
+            coords = f['geometry']['coordinates']
+            if f['properties']['class'].startswith('Bld') and len(coords) > 3:
+                footprint = Polygon(coords)
+                hull = footprint.convex_hull
+                if hull.geom_type == 'Polygon':
+                    # 経緯度のままではcvxpyの解が不安定なので原点付近に移す
+                    polygons.append(affinity.translate(hull, -hull.centroid.x, -hull.centroid.y))
+                    if footprint.is_valid and footprint.area < hull.area * (1 - 1e-3):
+                        footprints.append(affinity.translate(footprint, -hull.centroid.x, -hull.centroid.y))
+        if len(polygons) >= count and len(footprints) >= count:
+            break
+
+    def synthetic_footprints(count, seed=0):
+        # タイルストアに建物が無い場合に使う、L字・コの字・T字形と凹んだ多角形(原点付近)
+        rng = np.random.default_rng(seed)
+        result = []
+        while len(result) < count:
+            kind = rng.integers(4)
+            w, h = rng.uniform(5., 30., 2)
+            t = rng.uniform(0.2, 0.45)
+            if kind == 0:
+                coords = [(0, 0), (w, 0), (w, h * t), (w * t, h * t), (w * t, h), (0, h)]
+            elif kind == 1:
+                coords = [(0, 0), (w, 0), (w, h), (w * (1 - t), h), (w * (1 - t), h * t), (w * t, h * t), (w * t, h), (0, h)]
+            elif kind == 2:
+                x0, x1, y0 = w * (0.5 - t / 2), w * (0.5 + t / 2), h * (1 - t)
+                coords = [(x0, 0), (x1, 0), (x1, y0), (w, y0), (w, h), (0, h), (0, y0), (x0, y0)]
+            else:
+                k = rng.integers(5, 11)
+                angles = np.sort(rng.uniform(0, 2 * math.pi, k))
+                r = rng.uniform(0.3, 1.5, k) * w / 2
+                coords = np.c_[r * np.cos(angles), r * np.sin(angles)]
+            footprint = affinity.rotate(Polygon(coords), rng.uniform(0, 90), 'centroid')
+            footprint = affinity.translate(footprint, -footprint.centroid.x, -footprint.centroid.y)
+            if footprint.is_valid and footprint.area < footprint.convex_hull.area * (1 - 1e-3):
+                result.append(footprint)
+        return result
+
+    if len(footprints) == 0:
+        print('no footprints in the tile store, using synthetic footprints')
+        footprints = synthetic_footprints(count)
+        polygons = [affinity.translate(f.convex_hull, -f.convex_hull.centroid.x, -f.convex_hull.centroid.y) for f in footprints]
+    polygons = polygons[:count]
+    footprints = footprints[:count]
+    # makeScrollMap2 と同じ角度
+    rad_range = np.arange(0., math.pi / 2, math.pi / 16.)
+
+    def rotated_cvxpy(polygon):
+        # 角度ごとにcvxpyで解く従来の方法
+        result = None
+        for rad in rad_range:
+            rotated = affinity.rotate(polygon, rad, 'centroid', use_radians=True)
+            answer = Polygon(get_maximal_rectangle_cvxpy(list(rotated.exterior.coords)))
+            if result is None or answer.area > result.area:
+                result = answer
+        return result
+
+    def run(func, targets=polygons):
+        start = time.time()
+        areas = []
+        for p in targets:
+            try:
+                areas.append(func(p).area)
+            except Exception:
+                areas.append(0.)
+        return np.array(areas), time.time() - start
+
+    def report(name, a, b):
+        (areas_a, time_a), (areas_b, time_b) = a, b
+        ratio = areas_a / np.maximum(areas_b, 1e-30)
+        print(f'{name} closed form:{time_a:.3f}[sec] cvxpy:{time_b:.3f}[sec] speedup:{time_b / max(time_a, 1e-9):.1f}x')
+        print(f'{name} area ratio (closed form / cvxpy) min:{ratio.min():.6f} median:{np.median(ratio):.6f} >=0.99999:{np.mean(ratio >= 0.99999) * 100:.1f}%')
+
+    print(f'polygons:{len(polygons)}')
+    report('axis-aligned',
+           run(lambda p: Polygon(get_maximal_rectangle(list(p.exterior.coords)))),
+           run(lambda p: Polygon(get_maximal_rectangle_cvxpy(list(p.exterior.coords)))))
+    report('rotated',
+           run(lambda p: get_maximal_rotated_rectangle(p, np.concatenate([rad_range, get_hull_angles(p)]))[0]),
+           run(rotated_cvxpy))
+
+    # makeScrollMap3 の等間隔の角度と、辺の向きから絞り込む探索の比較(角度ごとの計算回数も数える)。
+    # 凸包では縮める処理も半平面の共通部分も使わないので、凸でない建物の形状で比べる
+    dense_range = np.arange(0., math.pi, math.pi / 64.)
+    calls = [0]
+    rect_at = _rect_at
+
+    def _rect_at(*args):
+        calls[0] += 1
+        return rect_at(*args)
+
+    def run_counted(func):
+        calls[0] = 0
+        areas, elapsed = run(func, footprints)
+        return areas, elapsed, calls[0] / max(len(footprints), 1)
+
+    areas_a, time_a, calls_a = run_counted(lambda p: search_maximal_rotated_rectangle(p)[0])
+    areas_b, time_b, calls_b = run_counted(lambda p: get_maximal_rotated_rectangle(p, np.concatenate([dense_range, get_hull_angles(p)]))[0])
+    ratio = areas_a / np.maximum(areas_b, 1e-30)
+    print(f'non-convex footprints:{len(footprints)}')
+    print(f'angle search:{time_a:.3f}[sec] {calls_a:.1f}[calls/building] sweep:{time_b:.3f}[sec] {calls_b:.1f}[calls/building]')
+    print(f'angle search area ratio (search / sweep) min:{ratio.min():.6f} median:{np.median(ratio):.6f} mean:{ratio.mean():.6f} '
+          f'<0.99:{np.mean(ratio < 0.99) * 100:.2f}% <0.95:{np.mean(ratio < 0.95) * 100:.2f}%')
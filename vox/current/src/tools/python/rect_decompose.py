@@ -0,0 +1,139 @@
+import math
+import numpy as np
+import shapely
+from shapely import affinity,geometry
+from maxrect import get_seed_angles
+
+def _grid_lines(values,tol) :
+  # 頂点の座標を並べ、tol 以内の座標はまとめて1本の格子線にする
+  values = np.sort(values)
+  group = np.concatenate([[0],np.cumsum(np.diff(values) > tol)])
+  return np.bincount(group,values) / np.bincount(group)
+
+def _max_box(inside,xs,ys) :
+  """
+  格子の内側のセルだけからなる面積最大の矩形を求める。
+  行ごとに下から続く内側のセルの高さをヒストグラムとして、スタックで
+  ヒストグラム内の最大の矩形を求める(O(列数 * 行数))。セルの幅と高さは格子線の間隔
+  Parameters
+  ----------
+  inside : ndarray of bool
+      (行数, 列数) のセルが内側かどうか
+  xs, ys : ndarray of float
+      列・行の境界の座標
+  Returns
+  -------
+  box : tuple
+      (面積, 左の列, 右の列, 下の行, 上の行)。列・行は境界の番号
+  """
+  ny,nx = inside.shape
+  best = (0.,0,0,0,0)
+  run = np.zeros(nx,dtype=np.int64)
+  for j in range(ny) :
+    # j 行目を下端とする内側のセルの連続数と、その高さ
+    run = np.where(inside[j],run + 1,0)
+    heights = (ys[j + 1] - ys[j + 1 - run]).tolist() + [0.]
+    stack = []
+    for i,h in enumerate(heights) :
+      start = i
+      while(len(stack) > 0 and stack[-1][1] >= h) :
+        start,top = stack.pop()
+        area = top * (xs[i] - xs[start])
+        if(area > best[0]) :
+          rows = run[start:i].min()
+          best = (area,start,i,j + 1 - rows,j + 1)
+      stack.append((start,h))
+  return best
+
+def decompose_rectangles(polygon,max_boxes = 3,coverage = 0.9,min_box_rate = 0.05,tol = 0.02,max_lines = 32,budget = None) :
+  """
+  建物の形状を、主な辺の向きにそろえた重ならない矩形(最大 max_boxes 個)に分ける。
+  頂点の座標から格子を作り、中心が建物の内側にあるセルのうち面積最大の矩形を
+  取り除く操作を、矩形の面積の合計が建物の面積の coverage 以上になるまで繰り返す。
+  座標は経緯度として、経度に cos(緯度) を掛けた座標で分ける
+  Parameters
+  ----------
+  polygon : Polygon
+      建物の形状
+  max_boxes : int
+      矩形の最大数
+  coverage : float
+      矩形の面積の合計の目標(建物の面積に対する比)
+  min_box_rate : float
+      建物の面積に対する比がこれ未満の矩形は加えない
+  tol : float
+      建物の大きさに対する比がこれ以内の座標は同じ格子線にまとめる
+  max_lines : int
+      縦横の格子線の数の上限。超える場合は分割しない(計算量は格子のセル数に比例する)
+  budget : maxrect.Budget
+      計算時間と回数の上限(矩形1個ごとに数える)
+  Returns
+  -------
+  boxes : list of Polygon
+      面積の大きい順の矩形。分割できない場合は空のリスト
+  """
+  if(polygon.geom_type != 'Polygon' or polygon.area <= 0) :
+    return []
+  center = polygon.centroid
+  lon_scale = math.cos(math.radians(center.y))
+  metric = affinity.scale(polygon,lon_scale,1.0,origin=center)
+  angles = get_seed_angles(metric,1)
+  if(len(angles) == 0) :
+    return []
+  # 主な辺の向きを軸にそろえる
+  rotated = affinity.rotate(metric,-angles[0],origin=center,use_radians=True)
+  coords = shapely.get_coordinates(rotated)
+  extent = coords.max(axis=0) - coords.min(axis=0)
+  xs = _grid_lines(coords[:,0],tol * extent.max())
+  ys = _grid_lines(coords[:,1],tol * extent.max())
+  if(len(xs) < 2 or len(ys) < 2 or len(xs) > max_lines or len(ys) > max_lines) :
+    return []
+  cx,cy = np.meshgrid((xs[:-1] + xs[1:]) / 2,(ys[:-1] + ys[1:]) / 2)
+  inside = shapely.contains_xy(rotated,cx,cy)
+
+  boxes = []
+  covered = 0.
+  target_area = rotated.area
+  while(len(boxes) < max_boxes and covered < target_area * coverage) :
+    if(budget is not None) :
+      budget.check()
+    area,i0,i1,j0,j1 = _max_box(inside,xs,ys)
+    if(area < target_area * min_box_rate) :
+      break
+    inside[j0:j1,i0:i1] = False
+    covered += area
+    box = affinity.rotate(geometry.box(xs[i0],ys[j0],xs[i1],ys[j1]),angles[0],origin=center,use_radians=True)
+    boxes.append(affinity.scale(box,1 / lon_scale,1.0,origin=center))
+  return boxes
+
+if __name__ == "__main__":
+  # python rect_decompose.py [件数] : L字・コの字形の建物で1つの矩形(shrink_hull, angle_search)と比べる
+  import sys
+  import time
+  from simplify_strategies import simplify
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+  rng = np.random.default_rng(0)
+  targets = []
+  while(len(targets) < count) :
+    w,h = rng.uniform(1,3,2)
+    f = rng.uniform(0.3,0.7,2)
+    if(len(targets) % 2 == 0) :
+      # L字
+      pts = np.array([[0,0],[w,0],[w,h * f[1]],[w * f[0],h * f[1]],[w * f[0],h],[0,h]])
+    else :
+      # コの字
+      pts = np.array([[0,0],[w,0],[w,h],[w * 0.7,h],[w * 0.7,h * f[1]],[w * 0.3,h * f[1]],[w * 0.3,h],[0,h]])
+    a = rng.uniform(0,np.pi)
+    pts = pts @ np.array([[np.cos(a),np.sin(a)],[-np.sin(a),np.cos(a)]]) * 1e-4
+    # 経緯度の座標にする
+    target = geometry.Polygon(pts / [math.cos(math.radians(35.1)),1.] + [136.9,35.1])
+    if(target.is_valid) :
+      targets.append(target)
+  for name in ('shrink_hull','angle_search','rectilinear') :
+    start = time.time()
+    rects,_,tg_min_rate,_,_ = simplify(targets,name)
+    elapsed = time.time() - start
+    # 建物からはみ出した部分を除いた面積の比
+    inner = np.array([r.intersection(t).area / t.area if r is not None else 0. for r,t in zip(rects,targets)])
+    parts = np.array([len(shapely.get_parts(r)) if r is not None else 0 for r in rects])
+    print(f'{name}: {elapsed:.3f}[sec] tg_min_rate median:{np.median(tg_min_rate):.3f} inside median:{np.median(inner):.3f} min:{inner.min():.3f} boxes mean:{parts.mean():.2f}')
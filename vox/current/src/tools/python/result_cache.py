@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+import numpy as np
+
+# 建物の処理結果を保存するSQLiteデータベース
+result_cache_path = '../../temp/cache/results.sqlite'
+
+def get_result_key(coords,feature_type,tile,version,params = None) :
+  """
+  建物の処理結果のキーを作る。座標・タイプ・処理の版・パラメーターのどれかが
+  変わればキーも変わる
+  Parameters
+  ----------
+  coords : ndarray
+      結合した建物の外周の座標
+  feature_type : str
+      建物のタイプ
+  tile : tuple of int
+      建物の属するFGDタイルの (X, Y)
+  version : int
+      処理の版。結果が変わる修正をしたら上げる
+  params : dict
+      結果に影響するパラメーター
+  Returns
+  -------
+  key : str
+      SHA-1 の16進文字列
+  """
+  h = hashlib.sha1()
+  h.update(np.ascontiguousarray(coords,dtype='<f8').tobytes())
+  h.update(json.dumps([feature_type,list(tile),version,params or {}],ensure_ascii=False,sort_keys=True).encode('utf-8'))
+  return h.hexdigest()
+
+class ResultCache :
+  """
+  キーと処理結果(JSONにできる値)を保存するキャッシュ。
+  件数が上限を超えたら最後に使った日時の古いものから削除する
+  """
+  def __init__(self,path = result_cache_path,max_entries = 500000) :
+    os.makedirs(os.path.dirname(path) or '.',exist_ok=True)
+    self.max_entries = max_entries
+    self.db = sqlite3.connect(path)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('''CREATE TABLE IF NOT EXISTS results (
+      key TEXT PRIMARY KEY,
+      data BLOB NOT NULL,
+      used_at REAL NOT NULL)''')
+    self.db.execute('CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at)')
+    self.db.commit()
+
+  def get_many(self,keys) :
+    """
+    複数の結果をまとめて取得し、最後に使った日時を更新する
+    Returns
+    -------
+    results : dict
+        キーと結果の辞書(未保存のものは含まない)
+    """
+    keys = list(dict.fromkeys(keys))
+    result = {}
+    for i in range(0,len(keys),500) :
+      chunk = keys[i:i + 500]
+      rows = self.db.execute(f"SELECT key,data FROM results WHERE key IN ({','.join(['?'] * len(chunk))})",chunk)
+      for key,data in rows :
+        result[key] = json.loads(zlib.decompress(data).decode('utf-8'))
+    now = time.time()
+    with self.db :
+      self.db.executemany('UPDATE results SET used_at=? WHERE key=?',[(now,key) for key in result])
+    return result
+
+  def put_many(self,items) :
+    """
+    複数の結果を保存し、上限を超えた分を削除する
+    Parameters
+    ----------
+    items : iterable of (str, object)
+        キーと結果のリスト
+    """
+    now = time.time()
+    rows = [(key,zlib.compress(json.dumps(value,ensure_ascii=False).encode('utf-8')),now) for key,value in items]
+    with self.db :
+      self.db.executemany('INSERT OR REPLACE INTO results VALUES (?,?,?)',rows)
+      count = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+      if(count > self.max_entries) :
+        self.db.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used_at LIMIT ?)',(count - self.max_entries,))
+
+  def close(self) :
+    self.db.close()
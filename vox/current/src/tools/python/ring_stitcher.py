@@ -0,0 +1,56 @@
+def _key(pt,ndigits) :
+  return (round(pt[0],ndigits),round(pt[1],ndigits))
+
+def stitch_fragments(fragments,ndigits = 8) :
+  """
+  分割された建物の外周の断片を端点でつなぎ、リングにまとめる。
+  端点をハッシュで引くので断片の数に対して線形時間で処理する
+  Parameters
+  ----------
+  fragments : list of list
+      断片ごとの [x, y] のリスト(タイルをまたいでいても、向きが逆でもよい)
+  ndigits : int
+      端点を同一とみなす小数点以下の桁数
+  Returns
+  -------
+  chains : list of (list, bool)
+      つないだ座標のリストと、閉じたリングかどうかの組のリスト(長い順)
+  """
+  fragments = [f for f in fragments if len(f) > 0]
+  # 端点 -> (断片の番号, 始点かどうか)
+  ends = {}
+  for i,f in enumerate(fragments) :
+    ends.setdefault(_key(f[0],ndigits),[]).append((i,True))
+    ends.setdefault(_key(f[-1],ndigits),[]).append((i,False))
+  used = [False] * len(fragments)
+
+  def take(pt) :
+    # ptを端点に持つ未使用の断片を、ptから始まる向きで取り出す
+    for i,is_start in ends.get(_key(pt,ndigits),()) :
+      if(not used[i]) :
+        used[i] = True
+        return fragments[i] if is_start else fragments[i][::-1]
+    return None
+
+  chains = []
+  for i,f in enumerate(fragments) :
+    if(used[i]) :
+      continue
+    used[i] = True
+    chain = list(f)
+    # 後ろに伸ばす
+    while(_key(chain[0],ndigits) != _key(chain[-1],ndigits) or len(chain) < 2) :
+      nxt = take(chain[-1])
+      if(nxt is None) :
+        break
+      chain += nxt[1:]
+    # 閉じていなければ前にも伸ばす
+    while(_key(chain[0],ndigits) != _key(chain[-1],ndigits)) :
+      prv = take(chain[0])
+      if(prv is None) :
+        break
+      chain = prv[::-1] + chain[1:]
+    closed = len(chain) > 3 and _key(chain[0],ndigits) == _key(chain[-1],ndigits)
+    chains.append((chain,closed))
+  chains.sort(key=lambda c : len(c[0]),reverse=True)
+  return chains
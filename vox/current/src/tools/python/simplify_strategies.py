@@ -0,0 +1,279 @@
+import math
+import time
+import numpy as np
+import shapely
+from shapely import geometry
+from batch_simplify import simplize_rects
+from maxrect import get_maximal_rectangle,get_maximal_rotated_rectangle,get_hull_angles,search_maximal_rotated_rectangle,BudgetExceeded
+from rect_decompose import decompose_rectangles
+
+# 名前で選べる単純化の方法。どれも建物の形状の配列と建物1件あたりの Budget を受け取り、
+# 同じ長さの形状の配列(単純化できないものは None、Budget を超えたものは TIMED_OUT)を返す
+strategies = {}
+
+# Budget を超えて打ち切った建物の結果
+TIMED_OUT = 'timed_out'
+
+# 複数の方法を順に試す組み合わせ。(方法の名前, 下限) のリストで、結果のうち建物に含まれる部分の
+# 面積の比が下限未満か単純化できなかった建物だけを次の方法で処理する。下限が None の方法は最後に使う
+policies = {
+  # 安い shrink_footprint を先に使い、元の面積の2割に満たない建物だけ角度を振って最大の内接矩形を求める
+  # (makeScrollMap3 の方法)
+  'tiered':[('shrink_footprint',0.2),('angle_search',None)],
+  # 内接矩形も求まらない建物は凸包をそのまま使う
+  'tiered_hull':[('shrink_footprint',0.2),('angle_search',0.05),('convex_hull',None)],
+  # L字・コの字形など、1つの矩形では面積の9割に満たない建物は複数の矩形に分ける
+  'tiered_boxes':[('shrink_hull',0.9),('rectilinear',None)]
+}
+
+def register_strategy(name) :
+  """
+  単純化の方法を strategies に登録するデコレーター
+  """
+  def register(func) :
+    strategies[name] = func
+    return func
+  return register
+
+def _each(targets,func,budget) :
+  # 1件ずつ処理し、失敗したものは None、Budget を超えたものは TIMED_OUT にする
+  result = np.full(len(targets),None,dtype=object)
+  for i,target in enumerate(targets) :
+    try :
+      result[i] = func(target,budget.start() if budget is not None else None)
+    except BudgetExceeded :
+      result[i] = TIMED_OUT
+    except Exception :
+      result[i] = None
+  return result
+
+@register_strategy('shrink_hull')
+def shrink_hull(targets,budget = None) :
+  # 最小回転外接矩形を凸包に収まるまで縮める(makeScrollMap4/5)
+  return simplize_rects(targets)[0]
+
+@register_strategy('shrink_footprint')
+def shrink_footprint(targets,budget = None) :
+  # 最小回転外接矩形を建物の重心に移し、各頂点から重心への線分が建物と交わる部分の
+  # 長さの比の最小値で縮める(makeScrollMap3 の simplize_1)。L字形などの凹んだ建物も建物の形状で縮める
+  def simplize(target,budget) :
+    rect = shapely.minimum_rotated_rectangle(target)
+    if(rect.geom_type != 'Polygon') :
+      return None
+    center = np.asarray(target.centroid.coords[0])
+    corners = np.asarray(rect.exterior.coords)[:4] + (center - rect.centroid.coords[0])
+    lines = shapely.linestrings(np.stack([corners,np.broadcast_to(center,corners.shape)],axis=1))
+    parts,index = shapely.get_parts(shapely.intersection(target,lines),return_index=True)
+    rates = shapely.length(parts) / shapely.length(lines)[index]
+    # 建物と交わらない線分があれば縮めた矩形は点になる
+    rate = rates.min() if len(np.unique(index)) == len(lines) else 0.
+    if(rate <= 0.) :
+      return None
+    return shapely.polygons(center + (corners - center) * rate)
+  return _each(targets,simplize,budget)
+
+@register_strategy('maxrect')
+def maxrect(targets,budget = None) :
+  # 凸包に内接する最大の軸平行矩形(makeScrollMap)
+  def simplize(target,budget) :
+    hull = target.convex_hull
+    if(hull.geom_type != 'Polygon') :
+      return None
+    return geometry.Polygon(get_maximal_rectangle(list(hull.exterior.coords)))
+  return _each(targets,simplize,budget)
+
+# makeScrollMap2 で試す角度
+sweep_angles = np.arange(0.,math.pi / 2,math.pi / 16.)
+
+@register_strategy('angle_sweep')
+def angle_sweep(targets,budget = None) :
+  # 角度を振って求めた最大の内接回転矩形(makeScrollMap2)
+  def simplize(target,budget) :
+    if(target.geom_type != 'Polygon') :
+      return None
+    return get_maximal_rotated_rectangle(target,np.concatenate([sweep_angles,get_hull_angles(target)]),budget)[0]
+  return _each(targets,simplize,budget)
+
+@register_strategy('angle_search')
+def angle_search(targets,budget = None) :
+  # angle_sweep と同じ内接回転矩形を、辺の向きから角度を絞り込んで少ない計算回数で求める
+  def simplize(target,budget) :
+    if(target.geom_type != 'Polygon') :
+      return None
+    return search_maximal_rotated_rectangle(target,budget=budget)[0]
+  return _each(targets,simplize,budget)
+
+@register_strategy('rectilinear')
+def rectilinear(targets,budget = None) :
+  # 主な辺の向きにそろえた最大3個の矩形に分ける。複数の場合は MultiPolygon
+  def simplize(target,budget) :
+    boxes = decompose_rectangles(target,budget=budget)
+    if(len(boxes) == 0) :
+      return None
+    return boxes[0] if len(boxes) == 1 else geometry.MultiPolygon(boxes)
+  return _each(targets,simplize,budget)
+
+@register_strategy('convex_hull')
+def convex_hull(targets,budget = None) :
+  # 凸包をそのまま使う(makeScrollMapCH)
+  hulls = shapely.convex_hull(np.asarray(targets,dtype=object))
+  return np.where(shapely.get_type_id(hulls) == shapely.GeometryType.POLYGON,hulls,None)
+
+def get_policy(name) :
+  """
+  名前から方法の組み合わせを返す。policies に無い名前は strategies の方法を単独で使う
+  Returns
+  -------
+  tiers : list of (str, float)
+      (方法の名前, 建物に含まれる部分の面積の比の下限) のリスト
+  """
+  if(name in policies) :
+    return policies[name]
+  if(name in strategies) :
+    return [(name,None)]
+  raise ValueError(f'unknown simplify strategy: {name}')
+
+class SimplifyStats :
+  """
+  方法ごとの処理件数・採用件数・処理時間を集計する
+  """
+  def __init__(self) :
+    self.counts = {}
+
+  def add(self,name,buildings = 0,hits = 0,elapsed = 0.) :
+    count = self.counts.setdefault(name,{'buildings':0,'hits':0,'time':0.})
+    count['buildings'] += buildings
+    count['hits'] += hits
+    count['time'] += elapsed
+
+  def merge(self,other) :
+    # 子プロセスの集計を合わせる
+    for name,count in other.counts.items() :
+      self.add(name,count['buildings'],count['hits'],count['time'])
+
+  def report(self) :
+    lines = []
+    for name,count in self.counts.items() :
+      per_building = count['time'] / count['buildings'] * 1000 if count['buildings'] > 0 else 0.
+      lines.append(f"{name}: buildings:{count['buildings']} hits:{count['hits']} time:{count['time']:.3f}[sec] ({per_building:.3f}[msec/building])")
+    return '\n'.join(lines)
+
+def simplify(targets,policy = 'shrink_hull',stats = None,budget = None) :
+  """
+  建物の形状をまとめて単純化する。policy の方法を順に試し、結果のうち建物に含まれる
+  部分の面積 / 建物の面積 が下限未満の建物だけを次の方法で処理する。
+  (凸包で縮めた矩形は凹んだ建物からはみ出すので、はみ出した部分は数えない)
+  複数の方法の結果がある場合は建物に含まれる部分の面積の大きい方を使う。
+  budget を超えた建物はそれ以上の方法を試さず、前の方法の結果が無ければ
+  最小回転外接矩形にする
+  Parameters
+  ----------
+  targets : array_like of Geometry
+      建物の形状の配列
+  policy : str
+      policies または strategies の名前
+  stats : SimplifyStats
+      方法ごとの集計を加える
+  budget : Budget
+      建物1件あたりの計算時間と回数の上限
+  Returns
+  -------
+  rects : ndarray of Geometry
+      単純化した形状。単純化できないものは None
+  tg_cv_rate : ndarray of float
+      建物の面積 / 凸包の面積(凸包の面積が0の場合は0)
+  tg_min_rate : ndarray of float
+      単純化した形状の面積 / 建物の面積(建物の面積が0の場合は0)
+  used : ndarray of str
+      建物ごとに採用した方法の名前(単純化できないものは None)
+  timed_out : ndarray of bool
+      budget を超えて打ち切った建物
+  """
+  targets = np.asarray(targets,dtype=object)
+  n = len(targets)
+  rects = np.full(n,None,dtype=object)
+  used = np.full(n,None,dtype=object)
+  tg_cv_rate = np.zeros(n)
+  tg_min_rate = np.zeros(n)
+  # 採用した結果のうち建物に含まれる部分の面積 / 建物の面積
+  inside_rate = np.zeros(n)
+  timed_out = np.zeros(n,dtype=bool)
+  if(n == 0) :
+    return rects,tg_cv_rate,tg_min_rate,used,timed_out
+
+  target_areas = shapely.area(targets)
+  hull_areas = shapely.area(shapely.convex_hull(targets))
+  np.divide(target_areas,hull_areas,out=tg_cv_rate,where=hull_areas > 0)
+  # 不正な形状(自己交差など)とは共通部分を求められないので、結果の面積をそのまま使う
+  valid = shapely.is_valid(targets)
+
+  todo = np.arange(n)
+  for name,min_rate in get_policy(policy) :
+    if(len(todo) == 0) :
+      break
+    start = time.time()
+    results = strategies[name](targets[todo],budget)
+    elapsed = time.time() - start
+
+    stopped = np.array([r is TIMED_OUT for r in results],dtype=bool)
+    results[stopped] = None
+    done = np.array([r is not None for r in results],dtype=bool)
+    areas = np.zeros(len(todo))
+    areas[done] = shapely.area(results[done])
+    inside_areas = areas.copy()
+    clip = done & valid[todo]
+    inside_areas[clip] = shapely.area(shapely.intersection(results[clip],targets[todo[clip]]))
+    rates = np.zeros(len(todo))
+    np.divide(areas,target_areas[todo],out=rates,where=target_areas[todo] > 0)
+    inside_rates = np.zeros(len(todo))
+    np.divide(inside_areas,target_areas[todo],out=inside_rates,where=target_areas[todo] > 0)
+    # 前の方法の結果より建物に含まれる部分が大きいものだけを採用する
+    better = done & ((rects[todo] == None) | (inside_rates > inside_rate[todo]))
+    rects[todo[better]] = results[better]
+    used[todo[better]] = name
+    tg_min_rate[todo[better]] = rates[better]
+    inside_rate[todo[better]] = inside_rates[better]
+    if(stats is not None) :
+      stats.add(name,len(todo),int(better.sum()),elapsed)
+
+    if(stopped.any()) :
+      timed_out[todo[stopped]] = True
+      _fallback(targets,todo[stopped],rects,tg_min_rate,used,target_areas,stats)
+      todo = todo[~stopped]
+    if(min_rate is None) :
+      break
+    todo = todo[(rects[todo] == None) | (inside_rate[todo] < min_rate)]
+  return rects,tg_cv_rate,tg_min_rate,used,timed_out
+
+def _fallback(targets,index,rects,tg_min_rate,used,target_areas,stats) :
+  # 打ち切った建物のうち、前の方法の結果が無いものを最小回転外接矩形にする
+  start = time.time()
+  index = index[rects[index] == None]
+  fallbacks = shapely.minimum_rotated_rectangle(targets[index])
+  ok = shapely.get_type_id(fallbacks) == shapely.GeometryType.POLYGON
+  index,fallbacks = index[ok],fallbacks[ok]
+  rects[index] = fallbacks
+  used[index] = 'minimum_rotated_rectangle'
+  areas = target_areas[index]
+  tg_min_rate[index] = np.where(areas > 0,shapely.area(fallbacks) / np.where(areas > 0,areas,1.),0.)
+  if(stats is not None and len(index) > 0) :
+    stats.add('minimum_rotated_rectangle',len(index),len(index),time.time() - start)
+
+if __name__ == "__main__":
+  # python simplify_strategies.py [件数] : 方法ごとの時間と tg_min_rate を比べる
+  import sys
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+  rng = np.random.default_rng(0)
+  targets = []
+  while(len(targets) < count) :
+    k = rng.integers(4,10)
+    angles = np.sort(rng.uniform(0,2 * np.pi,k))
+    r = rng.uniform(0.3,1.5,k)
+    target = geometry.Polygon(np.c_[r * np.cos(angles),r * np.sin(angles)] * 1e-4 + [136.9,35.1])
+    if(target.is_valid) :
+      targets.append(target)
+  for name in list(strategies) + list(policies) :
+    stats = SimplifyStats()
+    rects,_,tg_min_rate,_,_ = simplify(targets,name,stats)
+    print(f'[{name}] tg_min_rate median:{np.median(tg_min_rate):.3f} <0.2:{np.mean(tg_min_rate < 0.2) * 100:.1f}%')
+    print(stats.report())
@@ -0,0 +1,86 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+import pytest
+from tile_downloader import download_tiles,EMPTY_TILE
+from tile_store import TileStore
+
+# テスト用のタイル。X座標ごとにローカルサーバーの応答を変える
+TILE = '{"type":"FeatureCollection","features":[{"type":"Feature","properties":{},"geometry":null}]}'
+OK,NOT_FOUND,FORBIDDEN,RETRY = 1,2,3,4
+
+class TileHandler(BaseHTTPRequestHandler) :
+  requests = {}
+
+  def do_GET(self) :
+    # /レイヤー名/ズーム率/X/Y.geojson
+    x = int(self.path.split('/')[3])
+    count = self.requests[x] = self.requests.get(x,0) + 1
+    if(x == NOT_FOUND) :
+      self.send_error(404)
+    elif(x == FORBIDDEN) :
+      self.send_error(403)
+    elif(x == RETRY and count == 1) :
+      self.send_error(503)
+    else :
+      body = TILE.encode('utf-8')
+      self.send_response(200)
+      self.send_header('Content-Type','application/json')
+      self.send_header('Content-Length',str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+  def log_message(self,*args) :
+    pass
+
+@pytest.fixture
+def server() :
+  TileHandler.requests = {}
+  httpd = ThreadingHTTPServer(('127.0.0.1',0),TileHandler)
+  thread = threading.Thread(target=httpd.serve_forever,daemon=True)
+  thread.start()
+  yield f'http://127.0.0.1:{httpd.server_address[1]}'
+  httpd.shutdown()
+  httpd.server_close()
+
+@pytest.fixture
+def store(tmp_path) :
+  store = TileStore(str(tmp_path / 'tiles.sqlite'))
+  yield store
+  store.close()
+
+def download(server,store,xs) :
+  return download_tiles([('fgd',x,0) for x in xs],concurrency=2,retries=2,backoff=0.01,url=server,timeout=10,store=store)
+
+def test_download_status(server,store) :
+  result = download(server,store,[OK,NOT_FOUND,FORBIDDEN,RETRY])
+  assert sorted(result['fetched']) == [('fgd',OK,0),('fgd',RETRY,0)]
+  assert result['missing'] == [('fgd',NOT_FOUND,0)]
+  assert result['failed'] == [('fgd',FORBIDDEN,0)]
+  assert result['cached'] == []
+  # 503 は再試行し、403 は再試行しない
+  assert TileHandler.requests[RETRY] == 2
+  assert TileHandler.requests[FORBIDDEN] == 1
+
+  assert json.loads(store.get('fgd',18,OK,0)) == json.loads(TILE)
+  assert store.get('fgd',18,RETRY,0) == TILE
+  # データの無いタイルは空のFeatureCollectionとして保存する
+  assert store.get('fgd',18,NOT_FOUND,0) == EMPTY_TILE
+  assert store.get('fgd',18,FORBIDDEN,0) is None
+
+def test_resume(server,store) :
+  download(server,store,[OK,NOT_FOUND,FORBIDDEN])
+  TileHandler.requests = {}
+  # 保存済みのタイルは取得せず、失敗したタイルだけを取得し直す
+  result = download(server,store,[OK,NOT_FOUND,FORBIDDEN,RETRY])
+  assert sorted(result['cached']) == [('fgd',OK,0),('fgd',NOT_FOUND,0)]
+  assert result['fetched'] == [('fgd',RETRY,0)]
+  assert result['failed'] == [('fgd',FORBIDDEN,0)]
+  assert sorted(TileHandler.requests) == [FORBIDDEN,RETRY]
+
+def test_overwrite(server,store) :
+  download(server,store,[OK])
+  result = download_tiles([('fgd',OK,0)],url=server,store=store,overwrite=True)
+  assert result['fetched'] == [('fgd',OK,0)]
+  assert result['cached'] == []
+  assert TileHandler.requests[OK] == 2
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import random
+import sys
+import aiohttp
+from tile_store import get_store
+
+# 地理院タイルの取得元
+base_url = 'https://cyberjapandata.gsi.go.jp/xyz'
+
+# レイヤー名とURL上のレイヤー名・旧キャッシュファイル(tile_store.pyで取り込む)の対応
+LAYERS = {
+  'fgd':{'url_name':'experimental_fgd','cache_dir':'../../temp/cache/fgd/','prefix':'fgd'},
+  'dem':{'url_name':'experimental_dem10b','cache_dir':'../../temp/cache/dem/','prefix':'dem10b'}
+}
+
+# データの無いタイル(404)の代わりに保存する空のFeatureCollection
+EMPTY_TILE = '{"type":"FeatureCollection","features":[]}'
+
+# 再試行するHTTPステータス
+RETRY_STATUS = (429,500,502,503,504)
+
+def get_tile_url(layer,x,y,zoom = 18,url = None) :
+  return f"{url or base_url}/{LAYERS[layer]['url_name']}/{zoom}/{x}/{y}.geojson"
+
+async def _fetch_tile(session,layer,x,y,zoom,url,retries,backoff) :
+  tile_url = get_tile_url(layer,x,y,zoom,url)
+  for attempt in range(retries + 1) :
+    try :
+      async with session.get(tile_url) as res :
+        if(res.status == 404) :
+          return 'missing',EMPTY_TILE
+        if(res.status not in RETRY_STATUS) :
+          res.raise_for_status()
+          text = await res.text()
+          json.loads(text)
+          return 'fetched',text
+        error = f'HTTP {res.status}'
+    except (aiohttp.ClientError,asyncio.TimeoutError,ValueError) as e :
+      if(isinstance(e,aiohttp.ClientResponseError) and e.status not in RETRY_STATUS) :
+        raise
+      error = e
+    if(attempt < retries) :
+      # 指数バックオフ + ジッター
+      await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+  raise IOError(f'{tile_url}: {error}')
+
+async def _download_all(store,tiles,zoom,concurrency,retries,backoff,url,timeout) :
+  queue = asyncio.Queue()
+  for tile in tiles :
+    queue.put_nowait(tile)
+
+  result = {'fetched':[],'missing':[],'failed':[]}
+  pending = []
+
+  def flush() :
+    store.put_many(pending)
+    pending.clear()
+
+  async def worker(session) :
+    while True :
+      try :
+        layer,x,y = queue.get_nowait()
+      except asyncio.QueueEmpty :
+        return
+      try :
+        status,text = await _fetch_tile(session,layer,x,y,zoom,url,retries,backoff)
+        pending.append((layer,zoom,x,y,text))
+        if(len(pending) >= 64) :
+          flush()
+        result[status].append((layer,x,y))
+      except Exception as e :
+        print(e)
+        result['failed'].append((layer,x,y))
+
+  # keep-aliveで接続を使い回し、同時接続数をconcurrencyで制限する
+  connector = aiohttp.TCPConnector(limit=concurrency,limit_per_host=concurrency,keepalive_timeout=30)
+  async with aiohttp.ClientSession(connector=connector,timeout=aiohttp.ClientTimeout(total=timeout)) as session :
+    await asyncio.gather(*[worker(session) for _ in range(concurrency)])
+  flush()
+  return result
+
+def download_tiles(tiles,zoom = 18,concurrency = 8,retries = 4,backoff = 0.5,url = None,timeout = 60,overwrite = False,store = None) :
+  """
+  タイルを並行してダウンロードし、タイルストアに保存する
+  Parameters
+  ----------
+  tiles : iterable of (str, int, int)
+      (レイヤー名, タイルのX座標, タイルのY座標) のリスト
+  zoom : int
+      タイルのズーム率
+  concurrency : int
+      同時に取得するタイルの最大数
+  retries : int
+      失敗時の再試行回数
+  backoff : float
+      再試行の待ち時間の基準値(秒)
+  url : str
+      取得元のURL。テスト用のローカルサーバーに差し替える場合に指定する
+  timeout : float
+      1リクエストあたりのタイムアウト(秒)
+  overwrite : bool
+      キャッシュ済みのタイルも取得し直すかどうか
+  store : TileStore
+      保存先のタイルストア。省略時は temp/cache/tiles.sqlite
+  Returns
+  -------
+  result : dict
+      'fetched','missing'(データなし),'failed','cached' ごとのタイルのリスト
+  """
+  store = store or get_store()
+  tiles = list(dict.fromkeys((layer,int(x),int(y)) for layer,x,y in tiles))
+  if(overwrite) :
+    targets = tiles
+  else :
+    targets = [(layer,x,y) for layer,_,x,y in store.missing([(layer,zoom,x,y) for layer,x,y in tiles])]
+  targets_set = set(targets)
+  cached = [t for t in tiles if t not in targets_set]
+
+  result = {'fetched':[],'missing':[],'failed':[]}
+  if(len(targets) > 0) :
+    result = asyncio.run(_download_all(store,targets,zoom,max(1,concurrency),retries,backoff,url,timeout))
+  result['cached'] = cached
+  return result
+
+if __name__ == "__main__":
+  # python tile_downloader.py tiles.json [concurrency]
+  # tiles.json : [["fgd",x,y],["dem",x,y],...]
+  with open(sys.argv[1],'r') as f :
+    tiles = json.load(f)
+  concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+  result = download_tiles(tiles,concurrency=concurrency)
+  print({k:len(v) for k,v in result.items()})
@@ -0,0 +1,187 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+import requests
+
+# タイルを1ファイルにまとめて保存するSQLiteデータベース
+store_path = '../../temp/cache/tiles.sqlite'
+
+class TileStore :
+  """
+  (レイヤー名, ズーム率, X, Y) をキーにタイルを圧縮して保存するタイルストア
+  """
+  def __init__(self,path = store_path) :
+    os.makedirs(os.path.dirname(path) or '.',exist_ok=True)
+    self.db = sqlite3.connect(path)
+    # 複数プロセスからの同時読み込みを許す
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('''CREATE TABLE IF NOT EXISTS tiles (
+      layer TEXT NOT NULL,
+      z INTEGER NOT NULL,
+      x INTEGER NOT NULL,
+      y INTEGER NOT NULL,
+      data BLOB NOT NULL,
+      fetched_at REAL NOT NULL,
+      PRIMARY KEY (layer,z,x,y))''')
+    self.db.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY,value TEXT)')
+    self.db.execute("INSERT OR IGNORE INTO metadata VALUES ('format','zlib')")
+    self.db.commit()
+
+  def get(self,layer,z,x,y) :
+    data = self.get_bytes(layer,z,x,y)
+    return data.decode('utf-8') if data is not None else None
+
+  def get_bytes(self,layer,z,x,y) :
+    row = self.db.execute('SELECT data FROM tiles WHERE layer=? AND z=? AND x=? AND y=?',(layer,z,x,y)).fetchone()
+    return zlib.decompress(row[0]) if row else None
+
+  def get_many(self,keys) :
+    """
+    複数のタイルをまとめて取得する
+    Parameters
+    ----------
+    keys : iterable of (str, int, int, int)
+        (レイヤー名, ズーム率, X, Y) のリスト
+    Returns
+    -------
+    tiles : dict
+        キーとタイルの文字列の辞書(未保存のタイルは含まない)
+    """
+    result = {}
+    for layer,z,x,y,data in self._select(keys,'data') :
+      result[(layer,z,x,y)] = zlib.decompress(data).decode('utf-8')
+    return result
+
+  def _select(self,keys,column) :
+    # SQLiteの変数の上限を超えないように分割して問い合わせる
+    keys = [tuple(key) for key in keys]
+    for i in range(0,len(keys),200) :
+      chunk = keys[i:i + 200]
+      values = ','.join(['(?,?,?,?)'] * len(chunk))
+      params = [v for key in chunk for v in key]
+      yield from self.db.execute(
+        f'SELECT layer,z,x,y,{column} FROM tiles WHERE (layer,z,x,y) IN (VALUES {values})',params)
+
+  def get_fetched_at(self,layer,z,x,y) :
+    row = self.db.execute('SELECT fetched_at FROM tiles WHERE layer=? AND z=? AND x=? AND y=?',(layer,z,x,y)).fetchone()
+    return row[0] if row else None
+
+  def put(self,layer,z,x,y,text,fetched_at = None) :
+    self.put_many([(layer,z,x,y,text,fetched_at)])
+
+  def put_many(self,items) :
+    """
+    複数のタイルを1トランザクションで保存する
+    Parameters
+    ----------
+    items : iterable of tuple
+        (レイヤー名, ズーム率, X, Y, 文字列またはbytes[, 取得日時]) のリスト
+    """
+    now = time.time()
+    rows = []
+    for item in items :
+      layer,z,x,y,text = item[0:5]
+      fetched_at = item[5] if len(item) > 5 and item[5] is not None else now
+      data = text if isinstance(text,bytes) else text.encode('utf-8')
+      rows.append((layer,z,x,y,zlib.compress(data),fetched_at))
+    with self.db :
+      self.db.executemany('INSERT OR REPLACE INTO tiles VALUES (?,?,?,?,?,?)',rows)
+
+  def delete(self,layer,z,x,y) :
+    # 壊れたタイルを削除し、次の読み込みで取得し直させる
+    with self.db :
+      self.db.execute('DELETE FROM tiles WHERE layer=? AND z=? AND x=? AND y=?',(layer,z,x,y))
+
+  def keys(self,layer) :
+    # レイヤーに保存されているタイルのキー
+    return [tuple(row) for row in self.db.execute('SELECT layer,z,x,y FROM tiles WHERE layer=?',(layer,))]
+
+  def missing(self,keys) :
+    # 未保存のタイルのキーを返す
+    keys = [tuple(key) for key in keys]
+    found = set((layer,z,x,y) for layer,z,x,y,_ in self._select(keys,'1'))
+    return [key for key in keys if key not in found]
+
+  def close(self) :
+    self.db.close()
+
+_store = None
+_store_pid = None
+
+def get_store() :
+  # プロセス内で共有するタイルストア。fork した子プロセスでは接続を開き直す
+  global _store,_store_pid
+  if(_store is None or _store_pid != os.getpid()) :
+    _store = TileStore()
+    _store_pid = os.getpid()
+  return _store
+
+def load_tile_text(layer,x,y,zoom = 18) :
+  """
+  タイルストアからタイルを読み込む。未保存の場合は取得して保存する。
+  404 はデータの無いタイルとして保存し、それ以外のエラーやJSONでない応答は保存せずに例外にする
+  Returns
+  -------
+  text : str
+      タイルのGeoJSONの文字列
+  """
+  from tile_downloader import get_tile_url,EMPTY_TILE
+  store = get_store()
+  text = store.get(layer,zoom,x,y)
+  if(text is None) :
+    res = requests.get(get_tile_url(layer,x,y,zoom))
+    if(res.status_code == 404) :
+      text = EMPTY_TILE
+    else :
+      res.raise_for_status()
+      text = res.text
+      json.loads(text)
+    store.put(layer,zoom,x,y,text)
+  return text
+
+def load_tile(layer,x,y,zoom = 18) :
+  # 読み込んだタイルのGeoJSONを返す。保存済みのタイルが壊れている場合は削除して取得し直す
+  try :
+    return json.loads(load_tile_text(layer,x,y,zoom))
+  except ValueError :
+    get_store().delete(layer,zoom,x,y)
+    return json.loads(load_tile_text(layer,x,y,zoom))
+
+def import_cache_dirs(store,zoom = 18) :
+  """
+  temp/cache/fgd, temp/cache/dem のタイルファイルをタイルストアに取り込む
+  Returns
+  -------
+  count : int
+      取り込んだタイルの数
+  """
+  from tile_downloader import LAYERS
+  count = 0
+  for layer,l in LAYERS.items() :
+    if(not os.path.isdir(l['cache_dir'])) :
+      continue
+    name_re = re.compile(rf"^{l['prefix']}(\d+)_(\d+)\.json$")
+    items = []
+    for name in os.listdir(l['cache_dir']) :
+      m = name_re.match(name)
+      if(m is None) :
+        continue
+      path = os.path.join(l['cache_dir'],name)
+      with open(path,'r') as f :
+        items.append((layer,zoom,int(m.group(1)),int(m.group(2)),f.read(),os.path.getmtime(path)))
+      if(len(items) >= 256) :
+        store.put_many(items)
+        count += len(items)
+        items = []
+    store.put_many(items)
+    count += len(items)
+  return count
+
+if __name__ == "__main__":
+  # python tile_store.py import : 既存のキャッシュディレクトリを取り込む
+  if(len(sys.argv) > 1 and sys.argv[1] == 'import') :
+    print(f'imported:{import_cache_dirs(get_store())}')